@@ -9,11 +9,14 @@
 #
 #########################################################################
 import os
+import logging
 
 from django.views.generic import TemplateView
 from django.utils.translation import ugettext_lazy as _
 from django.apps import apps, AppConfig as BaseAppConfig
 
+logger = logging.getLogger(__name__)
+
 
 def run_setup_hooks(*args, **kwargs):
     from geonode.urls import urlpatterns
@@ -25,6 +28,8 @@ def run_setup_hooks(*args, **kwargs):
         OWNER_PERMISSIONS
     )
     from geonode.groups.conf import settings as groups_settings
+    from geonode_mapstore_client import views
+    from geonode_mapstore_client.page_cache import cache_shell_page, cache_shell_url_patterns
 
     LOCAL_ROOT = os.path.abspath(os.path.dirname(__file__))
     settings.TEMPLATES[0]["DIRS"].insert(0, os.path.join(LOCAL_ROOT, "templates"))
@@ -62,12 +67,57 @@ def run_setup_hooks(*args, **kwargs):
     except Exception:
         pass
 
+    # refresh the layers index of the catalogue services in background
+    if getattr(settings, 'MAPSTORE_CATALOGUE_INDEX_ENABLED', False):
+        try:
+            settings.CELERY_BEAT_SCHEDULE['mapstore_refresh_catalogue_services_index'] = {
+                'task': 'geonode_mapstore_client.tasks.refresh_catalogue_services_index',
+                'schedule': getattr(settings, 'MAPSTORE_CATALOGUE_INDEX_REFRESH_INTERVAL', 60 * 60),
+                'options': {'queue': 'geonode'}
+            }
+        except Exception as e:
+            logger.error(f'Failed to schedule the catalogue services index refresh: {e}')
+
     urlpatterns += [
-        url(r'^catalogue/', TemplateView.as_view(template_name='geonode-mapstore-client/catalogue.html')),
+        url(
+            r'^catalogue/',
+            cache_shell_page(TemplateView.as_view(template_name='geonode-mapstore-client/catalogue.html'))
+        ),
+        url(r'^mapstore/local-config\.json$', views.local_config, name='mapstore_local_config'),
+        url(
+            r'^mapstore/translations/data\.(?P<locale>[\w-]+)\.json$',
+            views.translations,
+            name='mapstore_translations'
+        ),
+        url(r'^mapstore/metrics$', views.metrics, name='mapstore_metrics'),
+        url(r'^mapstore/proxy/$', views.proxy, name='mapstore_proxy'),
+        url(r'^mapstore/resources/(?P<pk>\d+)/blob$', views.resource_blob, name='mapstore_resource_blob'),
+        url(
+            r'^mapstore/geostories/(?P<pk>\d+)/skeleton\.json$',
+            views.geostory_skeleton,
+            name='mapstore_geostory_skeleton'
+        ),
+        url(
+            # the section ids can contain slashes, they are decoded before the url is resolved
+            r'^mapstore/geostories/(?P<pk>\d+)/sections/(?P<section_id>.+)\.json$',
+            views.geostory_section,
+            name='mapstore_geostory_section'
+        ),
+        url(
+            r'^mapstore/catalogue-services/(?P<service_id>[^/]+)/layers\.json$',
+            views.catalogue_service_layers,
+            name='mapstore_catalogue_service_layers'
+        ),
         # required, otherwise will raise no-lookup errors to be analysed
         url(r'^api/v2/', include(router.urls)),
     ]
 
+    # cache the embed pages rendered with the templates of the MapStoreHookSet
+    try:
+        cache_shell_url_patterns(urlpatterns)
+    except Exception as e:
+        logger.error(f'Failed to enable the cache of the embed pages: {e}')
+
     # adding default format for metadata schema validation
     settings.EXTRA_METADATA_SCHEMA = {
         **settings.EXTRA_METADATA_SCHEMA,
@@ -83,6 +133,172 @@ def connect_geoserver_style_visual_mode_signal():
 
     geoserver_automatic_default_style_set.connect(set_default_style_to_open_in_visual_mode)
 
+
+def connect_menu_cache_invalidation_signals():
+    from django.db.models.signals import post_save, post_delete
+    from avatar.models import Avatar
+    from geonode.base.models import Configuration, Menu, MenuItem, MenuPlaceholder
+    from geonode_mapstore_client.templatetags.get_menu_json import (
+        invalidate_menu_cache,
+        invalidate_read_only_cache,
+        invalidate_avatar_url_cache
+    )
+
+    for model in (Menu, MenuItem, MenuPlaceholder):
+        post_save.connect(
+            invalidate_menu_cache,
+            sender=model,
+            dispatch_uid=f"mapstore_menu_cache_{model.__name__}_save")
+        post_delete.connect(
+            invalidate_menu_cache,
+            sender=model,
+            dispatch_uid=f"mapstore_menu_cache_{model.__name__}_delete")
+    post_save.connect(invalidate_read_only_cache, sender=Configuration, dispatch_uid="mapstore_read_only_cache_save")
+    post_save.connect(invalidate_avatar_url_cache, sender=Avatar, dispatch_uid="mapstore_avatar_url_cache_save")
+    post_delete.connect(invalidate_avatar_url_cache, sender=Avatar, dispatch_uid="mapstore_avatar_url_cache_delete")
+
+
+def connect_apikey_cache_invalidation_signals():
+    from django.db.models.signals import post_save, post_delete
+    from oauth2_provider.models import get_access_token_model
+    from geonode_mapstore_client.templatetags.apikey import invalidate_apikey_cache
+
+    AccessToken = get_access_token_model()
+    post_save.connect(invalidate_apikey_cache, sender=AccessToken, dispatch_uid="mapstore_apikey_cache_save")
+    post_delete.connect(invalidate_apikey_cache, sender=AccessToken, dispatch_uid="mapstore_apikey_cache_delete")
+
+
+def connect_dataset_lookup_cache_invalidation_signals():
+    from django.db.models.signals import post_save, post_delete
+    from geonode.layers.models import Dataset
+    from geonode_mapstore_client.hooksets import invalidate_dataset_lookup_cache
+
+    post_save.connect(
+        invalidate_dataset_lookup_cache,
+        sender=Dataset,
+        dispatch_uid="mapstore_dataset_lookup_cache_save")
+    post_delete.connect(
+        invalidate_dataset_lookup_cache,
+        sender=Dataset,
+        dispatch_uid="mapstore_dataset_lookup_cache_delete")
+
+
+def connect_blob_storage_signals():
+    from django.db.models.signals import pre_save
+    from geonode.base.models import ResourceBase
+    from geonode.maps.models import Map
+    from geonode.geoapps.models import GeoApp
+    from geonode_mapstore_client.inline_media import extract_inline_media_on_save
+
+    for model in (ResourceBase, Map, GeoApp):
+        pre_save.connect(
+            extract_inline_media_on_save,
+            sender=model,
+            dispatch_uid=f"mapstore_extract_inline_media_{model.__name__}")
+
+
+def connect_geostory_cache_invalidation_signals():
+    from django.db.models.signals import post_save, post_delete
+    from geonode.base.models import ResourceBase
+    from geonode.geoapps.models import GeoApp
+    from geonode_mapstore_client.geostory import invalidate_geostory_cache
+
+    for model in (ResourceBase, GeoApp):
+        post_save.connect(
+            invalidate_geostory_cache,
+            sender=model,
+            dispatch_uid=f"mapstore_geostory_cache_{model.__name__}_save")
+        post_delete.connect(
+            invalidate_geostory_cache,
+            sender=model,
+            dispatch_uid=f"mapstore_geostory_cache_{model.__name__}_delete")
+
+
+def connect_geonode_settings_cache_invalidation_signals():
+    from django.db.models.signals import post_save, post_delete
+    from django.test.signals import setting_changed
+    from geonode.upload.models import UploadSizeLimit, UploadParallelismLimit
+    from geonode_mapstore_client.context_processors import (
+        invalidate_upload_limits_cache,
+        invalidate_geonode_settings_cache
+    )
+
+    for model in (UploadSizeLimit, UploadParallelismLimit):
+        post_save.connect(
+            invalidate_upload_limits_cache,
+            sender=model,
+            dispatch_uid=f"mapstore_upload_limits_cache_{model.__name__}_save")
+        post_delete.connect(
+            invalidate_upload_limits_cache,
+            sender=model,
+            dispatch_uid=f"mapstore_upload_limits_cache_{model.__name__}_delete")
+    setting_changed.connect(
+        invalidate_geonode_settings_cache,
+        dispatch_uid="mapstore_geonode_settings_cache_setting_changed")
+
+
+def connect_shell_cache_invalidation_signals():
+    from django.contrib.auth import get_user_model
+    from django.db.models.signals import post_save, post_delete, m2m_changed
+    from avatar.models import Avatar
+    from guardian.models import UserObjectPermission, GroupObjectPermission
+    from oauth2_provider.models import get_access_token_model
+    from geonode.base.models import Configuration, Menu, MenuItem, MenuPlaceholder
+    from geonode_mapstore_client.page_cache import (
+        invalidate_shell_cache,
+        invalidate_shell_cache_on_resource_change,
+        invalidate_shell_cache_on_object_permission_change,
+        invalidate_shell_cache_on_user_change,
+        invalidate_shell_cache_on_user_related_change,
+        invalidate_shell_cache_on_user_groups_change
+    )
+
+    # the pages of a resource
+    post_save.connect(invalidate_shell_cache_on_resource_change, dispatch_uid="mapstore_shell_cache_resource_save")
+    post_delete.connect(invalidate_shell_cache_on_resource_change, dispatch_uid="mapstore_shell_cache_resource_delete")
+    for model in (UserObjectPermission, GroupObjectPermission):
+        post_save.connect(
+            invalidate_shell_cache_on_object_permission_change,
+            sender=model,
+            dispatch_uid=f"mapstore_shell_cache_{model.__name__}_save")
+        post_delete.connect(
+            invalidate_shell_cache_on_object_permission_change,
+            sender=model,
+            dispatch_uid=f"mapstore_shell_cache_{model.__name__}_delete")
+    # the pages of a user, they include the avatar and the apikey
+    User = get_user_model()
+    post_save.connect(invalidate_shell_cache_on_user_change, sender=User, dispatch_uid="mapstore_shell_cache_user_save")
+    m2m_changed.connect(
+        invalidate_shell_cache_on_user_groups_change,
+        sender=User.groups.through,
+        dispatch_uid="mapstore_shell_cache_user_groups_change")
+    for model in (Avatar, get_access_token_model()):
+        post_save.connect(
+            invalidate_shell_cache_on_user_related_change,
+            sender=model,
+            dispatch_uid=f"mapstore_shell_cache_{model.__name__}_save")
+        post_delete.connect(
+            invalidate_shell_cache_on_user_related_change,
+            sender=model,
+            dispatch_uid=f"mapstore_shell_cache_{model.__name__}_delete")
+    # all the pages
+    for model in (Configuration, Menu, MenuItem, MenuPlaceholder):
+        post_save.connect(
+            invalidate_shell_cache,
+            sender=model,
+            dispatch_uid=f"mapstore_shell_cache_{model.__name__}_save")
+        post_delete.connect(
+            invalidate_shell_cache,
+            sender=model,
+            dispatch_uid=f"mapstore_shell_cache_{model.__name__}_delete")
+
+
+def warm_up_caches():
+    from geonode_mapstore_client.templatetags.client_version import warm_client_version_cache
+
+    warm_client_version_cache()
+
+
 class AppConfig(BaseAppConfig):
 
     name = "geonode_mapstore_client"
@@ -93,4 +309,12 @@ class AppConfig(BaseAppConfig):
         if not apps.ready:
             run_setup_hooks()
             connect_geoserver_style_visual_mode_signal()
+            connect_menu_cache_invalidation_signals()
+            connect_apikey_cache_invalidation_signals()
+            connect_dataset_lookup_cache_invalidation_signals()
+            connect_blob_storage_signals()
+            connect_geostory_cache_invalidation_signals()
+            connect_geonode_settings_cache_invalidation_signals()
+            connect_shell_cache_invalidation_signals()
+            warm_up_caches()
         super(AppConfig, self).ready()
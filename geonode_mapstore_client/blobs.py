@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import copy
+import json
+import zlib
+import base64
+import hashlib
+
+from django.conf import settings
+
+from geonode_mapstore_client.local_config import apply_patch_rule
+
+COMPACT_BLOB_KEY = '__compact_blob__'
+COMPACT_BLOB_VERSION = 1
+COMPRESSED_ENCODING = 'zlib+base64'
+BLOB_PATCH_OPERATIONS = ('add', 'remove', 'replace', 'test')
+
+# frozen copies of configs/map.json and configs/geostory.json,
+# the compact blobs reference them by version so these must never change:
+# a new version has to be added when the default configs are updated
+BLOB_DEFAULTS = {
+    1: {
+        'map': {
+            'version': 2,
+            'catalogServices': {
+                'selectedService': 'GeoNode Catalogue',
+                'services': {
+                    'GeoNode Catalogue': {
+                        'autoload': True,
+                        'layerOptions': {
+                            'tileSize': 512
+                        },
+                        'title': 'GeoNode Catalogue',
+                        'type': 'csw',
+                        'url': '/catalogue/csw'
+                    }
+                }
+            },
+            'map': {
+                'projection': 'EPSG:900913',
+                'units': 'm',
+                'center': {
+                    'x': 1250000.0,
+                    'y': 5370000.0,
+                    'crs': 'EPSG:900913'
+                },
+                'zoom': 5,
+                'maxExtent': [
+                    -20037508.34,
+                    -20037508.34,
+                    20037508.34,
+                    20037508.34
+                ],
+                'layers': []
+            }
+        },
+        'geostory': {
+            'type': 'cascade',
+            'resources': [],
+            'settings': {
+                'theme': {
+                    'general': {
+                        'color': '#333333',
+                        'backgroundColor': '#ffffff',
+                        'borderColor': '#e6e6e6'
+                    },
+                    'overlay': {
+                        'backgroundColor': 'rgba(255, 255, 255, 0.75)',
+                        'borderColor': '#dddddd',
+                        'boxShadow': '0 14px 28px rgba(0,0,0,0.25), 0 10px 10px rgba(0,0,0,0.22)',
+                        'color': '#333333'
+                    }
+                }
+            },
+            'sections': [
+                {
+                    'type': 'title',
+                    'id': 'section_id',
+                    'title': 'Abstract',
+                    'cover': True,
+                    'contents': [
+                        {
+                            'id': 'content_id',
+                            'type': 'text',
+                            'size': 'large',
+                            'align': 'center',
+                            'theme': '',
+                            'html': '',
+                            'background': {
+                                'fit': 'cover',
+                                'size': 'full',
+                                'align': 'center'
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+    }
+}
+
+
+class BlobPatchError(ValueError):
+    pass
+
+
+def is_compact_blob(blob):
+    return isinstance(blob, dict) and COMPACT_BLOB_KEY in blob
+
+
+def _contains_null(value):
+    if isinstance(value, dict):
+        return any(item is None or _contains_null(item) for item in value.values())
+    if isinstance(value, list):
+        return any(_contains_null(item) for item in value)
+    return False
+
+
+def diff_merge_patch(source, target):
+    """
+    JSON merge patch (RFC 7386) transforming source into target,
+    target must not contain null values because they mean removal in a merge patch
+    """
+    patch = {}
+    for key, value in target.items():
+        if key not in source:
+            patch[key] = value
+        elif isinstance(value, dict) and isinstance(source[key], dict):
+            nested = diff_merge_patch(source[key], value)
+            if nested:
+                patch[key] = nested
+        elif value != source[key] or type(value) is not type(source[key]):
+            patch[key] = value
+    for key in source:
+        if key not in target:
+            patch[key] = None
+    return patch
+
+
+def apply_merge_patch(target, patch):
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = copy.deepcopy(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+
+def _get_compression_threshold():
+    return getattr(settings, 'MAPSTORE_BLOB_COMPRESSION_THRESHOLD', 64 * 1024)
+
+
+def compact_blob(blob, resource_type):
+    """
+    Store only the values different from the default config of the resource type
+    and compress the result when it's larger than MAPSTORE_BLOB_COMPRESSION_THRESHOLD
+    """
+    if not isinstance(blob, dict) or is_compact_blob(blob):
+        return blob
+    header = {'version': COMPACT_BLOB_VERSION}
+    data = blob
+    defaults = BLOB_DEFAULTS[COMPACT_BLOB_VERSION].get(resource_type)
+    if defaults is not None and not _contains_null(blob):
+        header['defaults'] = resource_type
+        data = diff_merge_patch(defaults, blob)
+    content = json.dumps(data, separators=(',', ':'))
+    threshold = _get_compression_threshold()
+    if threshold and len(content) > threshold:
+        header['encoding'] = COMPRESSED_ENCODING
+        data = base64.b64encode(zlib.compress(content.encode('utf-8'), 6)).decode('ascii')
+    if 'defaults' not in header and 'encoding' not in header:
+        return blob
+    return {COMPACT_BLOB_KEY: header, 'data': data}
+
+
+def expand_blob(blob):
+    """
+    Restore the original blob from its compact version, other values are returned as they are
+    """
+    if not is_compact_blob(blob):
+        return blob
+    header = blob[COMPACT_BLOB_KEY]
+    data = blob.get('data')
+    if header.get('encoding') == COMPRESSED_ENCODING:
+        data = json.loads(zlib.decompress(base64.b64decode(data)).decode('utf-8'))
+    defaults_name = header.get('defaults')
+    if defaults_name:
+        data = apply_merge_patch(BLOB_DEFAULTS[header.get('version', COMPACT_BLOB_VERSION)][defaults_name], data)
+    return data
+
+
+def get_blob_etag(blob):
+    return hashlib.md5(json.dumps(blob, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def apply_json_patch(blob, operations):
+    """
+    Apply a JSON patch (RFC 6902) with add, remove, replace and test operations,
+    only test is allowed on the root path and the blob is not modified when one of the operations fails
+    """
+    if not isinstance(operations, list):
+        raise BlobPatchError('The patch must be a list of operations')
+    document = copy.deepcopy(blob)
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('op') not in BLOB_PATCH_OPERATIONS:
+            raise BlobPatchError(f'Unsupported patch operation {operation}')
+        path = operation.get('path')
+        if not isinstance(path, str) or not (path == '' or path.startswith('/')):
+            raise BlobPatchError(f'Invalid patch path {path}')
+        if path == '' and operation['op'] != 'test':
+            # the whole blob cannot be removed or replaced
+            raise BlobPatchError(f'Unsupported {operation["op"]} operation on the root path')
+        try:
+            if operation['op'] == 'test':
+                if _resolve_pointer(document, path) != operation.get('value'):
+                    raise BlobPatchError(f'Test operation failed at {path}')
+            else:
+                document = apply_patch_rule(document, {
+                    'op': operation['op'],
+                    'path': path,
+                    'value': operation.get('value')
+                })
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            if isinstance(e, BlobPatchError):
+                raise
+            raise BlobPatchError(f'Failed to apply {operation["op"]} at {path}: {e}')
+    return document
+
+
+def _resolve_pointer(document, path):
+    value = document
+    if path == '':
+        return value
+    for token in path[1:].split('/'):
+        token = token.replace('~1', '/').replace('~0', '~')
+        value = value[int(token)] if isinstance(value, list) else value[token]
+    return value
+
+
+def is_blob_compaction_enabled():
+    return getattr(settings, 'MAPSTORE_COMPACT_BLOBS', False)
+
+
+def save_resource_blob(resource, blob):
+    """
+    Save the blob of a resource loaded from the database and compact it when MAPSTORE_COMPACT_BLOBS is enabled,
+    the receivers of the save signals get the expanded blob and the compact one replaces it in the same row
+    """
+    resource.blob = blob
+    resource.save(update_fields=['blob', 'last_updated'])
+    if not is_blob_compaction_enabled():
+        return
+    compact = compact_blob(resource.blob, resource.resource_type)
+    if compact is not resource.blob:
+        type(resource)._base_manager.filter(pk=resource.pk).update(blob=compact)
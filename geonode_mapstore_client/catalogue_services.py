@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import time
+import logging
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from defusedxml.ElementTree import iterparse
+
+from django.conf import settings
+from django.core.cache import cache
+
+from geonode_mapstore_client.proxy import get_proxy_session
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_INDEX_CACHE_KEY = 'geonode_mapstore_client.catalogue_index.{}'
+CATALOGUE_INDEX_PENDING_KEY = 'geonode_mapstore_client.catalogue_index_pending.{}'
+SUPPORTED_SERVICE_TYPES = ('wms', 'wmts', 'csw')
+CSW_PAGE_SIZE = 100
+
+
+def is_catalogue_index_enabled():
+    return getattr(settings, 'MAPSTORE_CATALOGUE_INDEX_ENABLED', False)
+
+
+def get_catalogue_index_refresh_interval():
+    return getattr(settings, 'MAPSTORE_CATALOGUE_INDEX_REFRESH_INTERVAL', 60 * 60)
+
+
+def get_indexed_catalogue_services():
+    """
+    Configured catalogue services of a type supported by the index
+    """
+    return {
+        service_id: service
+        for service_id, service in getattr(settings, 'MAPSTORE_CATALOGUE_SERVICES', {}).items()
+        if service.get('type') in SUPPORTED_SERVICE_TYPES and service.get('url')
+    }
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child_text(element, name):
+    for child in element:
+        if _local_name(child.tag) == name:
+            return (child.text or '').strip()
+    return ''
+
+
+def _child(element, name):
+    for child in element:
+        if _local_name(child.tag) == name:
+            return child
+    return None
+
+
+def _corners_bbox(element):
+    """
+    Bounding box of an ows bounding box element as [minx, miny, maxx, maxy]
+    """
+    if element is None:
+        return None
+    try:
+        minx, miny = [float(value) for value in _child_text(element, 'LowerCorner').split()]
+        maxx, maxy = [float(value) for value in _child_text(element, 'UpperCorner').split()]
+    except ValueError:
+        return None
+    return [minx, miny, maxx, maxy]
+
+
+def _iter_ended_elements(source, tags, on_start=None):
+    """
+    Parse the document incrementally and yield the elements with one of the given local names when they end.
+    The ended elements are then removed from their parent, unless they are in an element still to be yielded,
+    so only the open elements and the content of the ones to yield are kept in memory
+    """
+    elements = []
+    open_tags = 0
+    for event, element in iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            elements.append(element)
+            if _local_name(element.tag) in tags:
+                open_tags += 1
+            if on_start:
+                on_start(element)
+            continue
+        elements.pop()
+        if _local_name(element.tag) in tags:
+            open_tags -= 1
+            yield element
+        elif open_tags:
+            continue
+        if elements:
+            elements[-1].remove(element)
+
+
+def _wms_bbox(layer):
+    bbox = _child(layer, 'EX_GeographicBoundingBox')
+    if bbox is not None:
+        try:
+            return [float(_child_text(bbox, name)) for name in (
+                'westBoundLongitude', 'southBoundLatitude', 'eastBoundLongitude', 'northBoundLatitude')]
+        except ValueError:
+            return None
+    bbox = _child(layer, 'LatLonBoundingBox')
+    if bbox is not None:
+        try:
+            return [float(bbox.get(name)) for name in ('minx', 'miny', 'maxx', 'maxy')]
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def parse_wms_capabilities(source):
+    """
+    Compact entries of the named layers of a WMS capabilities document, parsed incrementally
+    """
+    layers = []
+    # the nested layers end and are removed before their parent
+    for element in _iter_ended_elements(source, ('Layer',)):
+        name = _child_text(element, 'Name')
+        if name:
+            layers.append({
+                'name': name,
+                'title': _child_text(element, 'Title') or name,
+                'abstract': _child_text(element, 'Abstract'),
+                'bbox': _wms_bbox(element)
+            })
+    return layers
+
+
+def parse_wmts_capabilities(source):
+    layers = []
+    for element in _iter_ended_elements(source, ('Layer',)):
+        name = _child_text(element, 'Identifier')
+        if name:
+            layers.append({
+                'name': name,
+                'title': _child_text(element, 'Title') or name,
+                'abstract': _child_text(element, 'Abstract'),
+                'bbox': _corners_bbox(_child(element, 'WGS84BoundingBox'))
+            })
+    return layers
+
+
+def _csw_bbox_element(record):
+    bbox = _child(record, 'BoundingBox')
+    return bbox if bbox is not None else _child(record, 'WGS84BoundingBox')
+
+
+def parse_csw_records(source):
+    """
+    Compact entries of the records of a CSW GetRecords response and the position of the next record
+    """
+    records = []
+    search_results = {}
+
+    def on_start(element):
+        if _local_name(element.tag) == 'SearchResults':
+            search_results['next_record'] = int(element.get('nextRecord') or 0)
+
+    for element in _iter_ended_elements(source, ('Record', 'SummaryRecord', 'BriefRecord'), on_start):
+        name = _child_text(element, 'identifier')
+        if name:
+            records.append({
+                'name': name,
+                'title': _child_text(element, 'title') or name,
+                'abstract': _child_text(element, 'abstract'),
+                'bbox': _corners_bbox(_csw_bbox_element(element))
+            })
+    return records, search_results.get('next_record', 0)
+
+
+def _get_url(url, params):
+    parts = urlsplit(url)
+    query = {key: value for key, value in parse_qsl(parts.query) if key.lower() not in {k.lower() for k in params}}
+    query.update(params)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+def _fetch(url, params, parse):
+    timeout = getattr(settings, 'MAPSTORE_PROXY_TIMEOUT', 30)
+    with get_proxy_session().get(_get_url(url, params), stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return parse(response.raw)
+
+
+def fetch_service_layers(service):
+    service_type = service['type']
+    if service_type == 'wms':
+        return _fetch(service['url'], {'SERVICE': 'WMS', 'REQUEST': 'GetCapabilities'}, parse_wms_capabilities)
+    if service_type == 'wmts':
+        return _fetch(service['url'], {'SERVICE': 'WMTS', 'REQUEST': 'GetCapabilities'}, parse_wmts_capabilities)
+    max_records = getattr(settings, 'MAPSTORE_CATALOGUE_INDEX_MAX_RECORDS', 10000)
+    records = []
+    start_position = 1
+    while start_position and len(records) < max_records:
+        page, start_position = _fetch(service['url'], {
+            'service': 'CSW',
+            'version': '2.0.2',
+            'request': 'GetRecords',
+            'typeNames': 'csw:Record',
+            'resultType': 'results',
+            'elementSetName': 'summary',
+            'startPosition': start_position,
+            'maxRecords': CSW_PAGE_SIZE
+        }, parse_csw_records)
+        if not page:
+            break
+        records.extend(page)
+    return records[:max_records]
+
+
+def refresh_catalogue_index(service_id):
+    """
+    Fetch the layers of a configured service and store their compact index in the Django cache
+    """
+    service = get_indexed_catalogue_services().get(service_id)
+    if not service:
+        return None
+    start = time.time()
+    layers = fetch_service_layers(service)
+    for layer in layers:
+        layer['search'] = ' '.join([layer['name'], layer['title'], layer['abstract']]).lower()
+    index = {
+        'updated': time.time(),
+        'layers': layers
+    }
+    # stale indexes are still served if a refresh fails
+    cache.set(CATALOGUE_INDEX_CACHE_KEY.format(service_id), index, get_catalogue_index_refresh_interval() * 24)
+    logger.debug(f'Indexed {len(layers)} layers of catalogue service {service_id} in {time.time() - start:.2f}s')
+    return index
+
+
+def get_catalogue_index(service_id):
+    return cache.get(CATALOGUE_INDEX_CACHE_KEY.format(service_id))
+
+
+def is_catalogue_index_stale(index):
+    return index is None or time.time() - index['updated'] > get_catalogue_index_refresh_interval()
+
+
+def search_catalogue_index(index, text='', page=1, page_size=20):
+    terms = text.lower().split()
+    layers = [
+        layer for layer in index['layers']
+        if all(term in layer['search'] for term in terms)
+    ] if terms else index['layers']
+    start = (page - 1) * page_size
+    return len(layers), [
+        {key: value for key, value in layer.items() if key != 'search'}
+        for layer in layers[start:start + page_size]
+    ]
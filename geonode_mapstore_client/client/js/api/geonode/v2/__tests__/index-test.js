@@ -11,7 +11,14 @@ import MockAdapter from 'axios-mock-adapter';
 import axios from '@mapstore/framework/libs/ajax';
 import {
     createMap,
-    updateMap
+    updateMap,
+    getConfiguration,
+    patchResourceBlob,
+    getMapByPk,
+    getGeoAppByPk,
+    getCatalogueServiceLayers,
+    getGeoStorySkeleton,
+    getGeoStorySection
 } from '@js/api/geonode/v2';
 
 let mockAxios;
@@ -25,6 +32,7 @@ describe('GeoNode v2 api', () => {
 
     afterEach(done => {
         delete global.__DEVTOOLS__;
+        delete window.__GEONODE_CONFIG__;
         mockAxios.restore();
         setTimeout(done);
     });
@@ -69,4 +77,166 @@ describe('GeoNode v2 api', () => {
 
         updateMap(id, mapConfiguration);
     });
+    it('should use the localConfig provided inline by the server (getConfiguration)', (done) => {
+        window.__GEONODE_CONFIG__ = {
+            serverLocalConfig: { plugins: { desktop: [{ name: 'Map' }] } },
+            serverLocalConfigPatchRules: [{ op: 'add', jsonpath: '/desktop/-', value: { name: 'Toolbar' } }],
+            pluginsConfigPatchRules: [{ op: 'add', jsonpath: '/desktop/-', value: { name: 'Applied by the server' } }]
+        };
+        mockAxios.onGet().reply(() => {
+            done(new Error('the localConfig should not be requested'));
+            return [ 404 ];
+        });
+        getConfiguration()
+            .then((localConfig) => {
+                expect(localConfig.plugins.desktop.map(({ name }) => name)).toEqual(['Map', 'Toolbar']);
+                done();
+            })
+            .catch(done);
+    });
+    it('should request the localConfig from the server endpoint (getConfiguration)', (done) => {
+        window.__GEONODE_CONFIG__ = {
+            serverLocalConfigUrl: '/mapstore/local-config.json',
+            serverLocalConfigPatchRules: [{ op: 'add', jsonpath: '/desktop/-', value: { name: 'Toolbar' } }],
+            pluginsConfigPatchRules: [{ op: 'add', jsonpath: '/desktop/-', value: { name: 'Applied by the server' } }]
+        };
+        mockAxios.onGet('/mapstore/local-config.json').reply(200, { plugins: { desktop: [{ name: 'Map' }] } });
+        getConfiguration()
+            .then((localConfig) => {
+                expect(localConfig.plugins.desktop.map(({ name }) => name)).toEqual(['Map', 'Toolbar']);
+                done();
+            })
+            .catch(done);
+    });
+    it('should request the static localConfig and apply all the patch rules (getConfiguration)', (done) => {
+        window.__GEONODE_CONFIG__ = {
+            pluginsConfigPatchRules: [{ op: 'add', jsonpath: '/desktop/-', value: { name: 'Toolbar' } }]
+        };
+        mockAxios.onGet('/static/mapstore/configs/localConfig.json').reply(200, { plugins: { desktop: [{ name: 'Map' }] } });
+        getConfiguration()
+            .then((localConfig) => {
+                expect(localConfig.plugins.desktop.map(({ name }) => name)).toEqual(['Map', 'Toolbar']);
+                done();
+            })
+            .catch(done);
+    });
+    it('should prefer the requested config url to the one provided by the server (getConfiguration)', (done) => {
+        window.__GEONODE_CONFIG__ = {
+            serverLocalConfig: { plugins: { desktop: [{ name: 'Map' }] } }
+        };
+        mockAxios.onGet('/static/custom/localConfig.json').reply(200, { plugins: { desktop: [{ name: 'Custom' }] } });
+        getConfiguration('/static/custom/localConfig.json')
+            .then((localConfig) => {
+                expect(localConfig.plugins.desktop.map(({ name }) => name)).toEqual(['Custom']);
+                done();
+            })
+            .catch(done);
+    });
+    it('should send the blob changes as JSON patch (patchResourceBlob)', (done) => {
+        const operations = [{ op: 'replace', path: '/map/zoom', value: 4 }];
+        mockAxios.onPatch('/mapstore/resources/1/blob')
+            .reply((config) => {
+                try {
+                    expect(config.data).toBe(JSON.stringify(operations));
+                    expect(config.headers['Content-Type']).toBe('application/json-patch+json');
+                    expect(config.headers['If-Match']).toBe('"etag"');
+                } catch (e) {
+                    done(e);
+                }
+                return [ 200, { map: { zoom: 4 } }, { etag: '"new-etag"' } ];
+            });
+        patchResourceBlob(1, operations, '"etag"')
+            .then(({ blob, etag }) => {
+                expect(blob).toEqual({ map: { zoom: 4 } });
+                expect(etag).toBe('"new-etag"');
+                done();
+            })
+            .catch(done);
+    });
+    it('should not send If-Match without etag (patchResourceBlob)', (done) => {
+        mockAxios.onPatch('/mapstore/resources/1/blob')
+            .reply((config) => {
+                try {
+                    expect(config.headers['If-Match']).toBe(undefined);
+                } catch (e) {
+                    done(e);
+                }
+                return [ 200, {}, { etag: '"etag"' } ];
+            });
+        patchResourceBlob(1, [])
+            .then(() => done())
+            .catch(done);
+    });
+    it('should expand the compact blob of a map with the blob endpoint (getMapByPk)', (done) => {
+        mockAxios.onGet('/api/v2/maps/1/').reply(200, { map: { pk: 1, data: { __compact_blob__: { version: 1 }, data: {} } } });
+        mockAxios.onGet('/mapstore/resources/1/blob').reply(200, { map: { zoom: 4 } });
+        getMapByPk(1)
+            .then((map) => {
+                expect(map).toEqual({ pk: 1, data: { map: { zoom: 4 } } });
+                done();
+            })
+            .catch(done);
+    });
+    it('should not request the blob endpoint for expanded blobs (getGeoAppByPk)', (done) => {
+        mockAxios.onGet('/api/v2/geoapps/1').reply(200, { geoapp: { pk: 1, data: { sections: [] } } });
+        mockAxios.onGet('/mapstore/resources/1/blob').reply(500);
+        getGeoAppByPk(1)
+            .then((geoapp) => {
+                expect(geoapp).toEqual({ pk: 1, data: { sections: [] } });
+                done();
+            })
+            .catch(done);
+    });
+    it('should request a page of the catalogue service layers (getCatalogueServiceLayers)', (done) => {
+        const layersIndexUrl = '/mapstore/catalogue-services/wms/layers.json';
+        mockAxios.onGet(layersIndexUrl)
+            .reply((config) => {
+                try {
+                    expect(config.params).toEqual({ q: 'roads', page: 2, page_size: 20 });
+                } catch (e) {
+                    done(e);
+                }
+                return [ 200, { total: 45, layers: [{ name: 'roads' }] } ];
+            });
+        getCatalogueServiceLayers(layersIndexUrl, { q: 'roads', page: 2 })
+            .then((response) => {
+                expect(response).toEqual({
+                    total: 45,
+                    isNextPageAvailable: true,
+                    layers: [{ name: 'roads' }]
+                });
+                done();
+            })
+            .catch(done);
+    });
+    it('should detect the last page of the catalogue service layers (getCatalogueServiceLayers)', (done) => {
+        const layersIndexUrl = '/mapstore/catalogue-services/wms/layers.json';
+        mockAxios.onGet(layersIndexUrl).reply(200, { total: 40, layers: [] });
+        getCatalogueServiceLayers(layersIndexUrl, { page: 2 })
+            .then(({ isNextPageAvailable }) => {
+                expect(isNextPageAvailable).toBe(false);
+                done();
+            })
+            .catch(done);
+    });
+    it('should request the geostory skeleton (getGeoStorySkeleton)', (done) => {
+        const skeleton = { sections: [{ id: 'section_id', type: 'title', title: 'Abstract' }] };
+        mockAxios.onGet('/mapstore/geostories/1/skeleton.json').reply(200, skeleton);
+        getGeoStorySkeleton(1)
+            .then((data) => {
+                expect(data).toEqual(skeleton);
+                done();
+            })
+            .catch(done);
+    });
+    it('should request a geostory section with an encoded id (getGeoStorySection)', (done) => {
+        const section = { section: { id: 'a/b' }, resources: [] };
+        mockAxios.onGet('/mapstore/geostories/1/sections/a%2Fb.json').reply(200, section);
+        getGeoStorySection(1, 'a/b')
+            .then((data) => {
+                expect(data).toEqual(section);
+                done();
+            })
+            .catch(done);
+    });
 });
@@ -330,6 +330,44 @@ export const getDocumentByPk = (pk) => {
         .then(({ data }) => data.document);
 };
 
+/**
+* Update the blob of a resource sending only the changes as JSON patch operations
+* @param {number} pk resource primary key
+* @param {array} operations JSON patch operations (add, remove, replace and test)
+* @param {string} etag ETag of the blob the operations have been computed from, the update fails with 412 if the blob changed
+* @return {promise} updated blob and its ETag
+*/
+export const patchResourceBlob = (pk, operations, etag) => {
+    return axios.patch(`/mapstore/resources/${pk}/blob`, operations, {
+        headers: {
+            'Content-Type': 'application/json-patch+json',
+            ...(etag && { 'If-Match': etag })
+        }
+    })
+        .then(({ data, headers }) => ({ blob: data, etag: headers.etag }));
+};
+
+/**
+* Get the settings, the list of sections and the first section of a geostory
+* @param {number} pk geostory primary key
+* @return {promise} geostory skeleton, `sections` contains only id, type and title of each section
+*/
+export const getGeoStorySkeleton = (pk) => {
+    return axios.get(`/mapstore/geostories/${pk}/skeleton.json`)
+        .then(({ data }) => data);
+};
+
+/**
+* Get the content of a section of a geostory and the resources it references
+* @param {number} pk geostory primary key
+* @param {string} sectionId section identifier
+* @return {promise} section and resources
+*/
+export const getGeoStorySection = (pk, sectionId) => {
+    return axios.get(`/mapstore/geostories/${pk}/sections/${encodeURIComponent(sectionId)}.json`)
+        .then(({ data }) => data);
+};
+
 export const createGeoApp = (body) => {
     return axios.post(parseDevHostname(`${endpoints[GEOAPPS]}`), body, {
         params: {
@@ -339,6 +377,19 @@ export const createGeoApp = (body) => {
         .then(({ data }) => data.geoapp);
 };
 
+/**
+* Replace the compact blob of a resource, returned as stored by the GeoNode api, with the expanded one
+* @param {object} resource resource with the blob in the data property
+* @return {promise} resource with the expanded blob
+*/
+const expandResourceData = (resource) => {
+    if (!resource?.data?.__compact_blob__) {
+        return Promise.resolve(resource);
+    }
+    return axios.get(`/mapstore/resources/${resource.pk}/blob`)
+        .then(({ data }) => ({ ...resource, data }));
+};
+
 export const getGeoAppByPk = (pk) => {
     return axios.get(parseDevHostname(`${endpoints[GEOAPPS]}/${pk}`), {
         params: {
@@ -346,7 +397,7 @@ export const getGeoAppByPk = (pk) => {
             include: ['data']
         }
     })
-        .then(({ data }) => data.geoapp);
+        .then(({ data }) => expandResourceData(data.geoapp));
 };
 
 
@@ -453,12 +504,58 @@ export const getAccountInfo = () => {
         .catch(() => null);
 };
 
-export const getConfiguration = (configUrl = '/static/mapstore/configs/localConfig.json') => {
-    return axios.get(configUrl)
-        .then(({ data }) => {
-            const geoNodePageConfig = window.__GEONODE_CONFIG__ || {};
+const getLocalConfig = (configUrl, geoNodePageConfig) => {
+    // the server provides the localConfig with part of the plugins config patch rules already applied
+    if (!configUrl && geoNodePageConfig.serverLocalConfig) {
+        return Promise.resolve({
+            data: geoNodePageConfig.serverLocalConfig,
+            pluginsConfigPatchRules: geoNodePageConfig.serverLocalConfigPatchRules || []
+        });
+    }
+    if (!configUrl && geoNodePageConfig.serverLocalConfigUrl) {
+        return axios.get(geoNodePageConfig.serverLocalConfigUrl)
+            .then(({ data }) => ({
+                data,
+                pluginsConfigPatchRules: geoNodePageConfig.serverLocalConfigPatchRules || []
+            }));
+    }
+    return axios.get(configUrl || '/static/mapstore/configs/localConfig.json')
+        .then(({ data }) => ({
+            data,
+            pluginsConfigPatchRules: geoNodePageConfig.pluginsConfigPatchRules || []
+        }));
+};
+
+/**
+* Get a page of the layers of a catalogue service from the index built by the server
+* @param {string} layersIndexUrl url of the layers index of the service (`layersIndexUrl` property of the catalogue service)
+* @param {object} options text filter and pagination
+* @return {promise} total count and layers with name, title, abstract and bbox
+*/
+export const getCatalogueServiceLayers = (layersIndexUrl, {
+    q,
+    page = 1,
+    pageSize = 20
+} = {}) => {
+    return axios.get(layersIndexUrl, {
+        params: {
+            ...(q && { q }),
+            page,
+            page_size: pageSize
+        }
+    })
+        .then(({ data }) => ({
+            total: data.total,
+            isNextPageAvailable: page * pageSize < data.total,
+            layers: data.layers
+        }));
+};
+
+export const getConfiguration = (configUrl) => {
+    const geoNodePageConfig = window.__GEONODE_CONFIG__ || {};
+    return getLocalConfig(configUrl, geoNodePageConfig)
+        .then(({ data, pluginsConfigPatchRules }) => {
             const geoNodePageLocalConfig = geoNodePageConfig.localConfig || {};
-            const pluginsConfigPatchRules = geoNodePageConfig.pluginsConfigPatchRules || [];
 
             const mergedLocalConfig  = mergeWith(
                 data,
@@ -584,7 +681,7 @@ export const getMapByPk = (pk) => {
                 include: ['data']
             }
         })
-        .then(({ data }) => data?.map);
+        .then(({ data }) => expandResourceData(data?.map));
 };
 
 export const getFeaturedResources = (page = 1, page_size =  4) => {
@@ -876,6 +973,10 @@ export default {
     getUsers,
     getAccountInfo,
     getConfiguration,
+    getCatalogueServiceLayers,
+    patchResourceBlob,
+    getGeoStorySkeleton,
+    getGeoStorySection,
     getResourceTypes,
     getResourcesTotalCount,
     getDatasetByPk,
@@ -8,21 +8,74 @@
 # LICENSE file in the root directory of this source tree.
 #
 #########################################################################
+import threading
 
 from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.html import json_script
 
 from geonode.upload.utils import get_max_upload_size, get_max_upload_parallelism_limit
 from geonode.utils import get_supported_datasets_file_types
 
-def resource_urls(request):
-    """Global values to pass to templates"""
-    defaults = dict(
-        GEOAPPS = ['GeoStory', 'GeoDashboard']
-    )
-    defaults['GEONODE_SETTINGS'] = {
+from geonode_mapstore_client.catalogue_services import (
+    get_indexed_catalogue_services,
+    is_catalogue_index_enabled
+)
+from geonode_mapstore_client.instrumentation import instrument
+from geonode_mapstore_client.local_config import (
+    get_plugins_config_patch_rules,
+    split_plugins_config_patch_rules
+)
+from geonode_mapstore_client.translations import (
+    get_translations_path,
+    get_translations_static_folders
+)
+
+UPLOAD_LIMITS_CACHE_KEY = 'geonode_mapstore_client.upload_limits'
+
+_geonode_settings_cache = {
+    'static': None,
+    'upload_limits': None,
+    'settings': None,
+    'json_script': None
+}
+_lock = threading.Lock()
+
+
+def _get_translations_path():
+    """
+    Use the endpoint merging all the translations folders
+    when all of them are served as static files
+    """
+    if getattr(settings, "MAPSTORE_SERVER_TRANSLATIONS", True) and get_translations_static_folders():
+        return [reverse('mapstore_translations', kwargs={'locale': 'en-US'}).rsplit('/', 1)[0]]
+    return get_translations_path()
+
+
+def _get_catalogue_services():
+    """
+    Add the url of the server side layers index to the indexed catalogue services
+    """
+    catalogue_services = getattr(settings, "MAPSTORE_CATALOGUE_SERVICES", {})
+    if not is_catalogue_index_enabled():
+        return catalogue_services
+    indexed_services = get_indexed_catalogue_services()
+    return {
+        service_id: {
+            **service,
+            'layersIndexUrl': reverse('mapstore_catalogue_service_layers', kwargs={'service_id': service_id})
+        } if service_id in indexed_services else service
+        for service_id, service in catalogue_services.items()
+    }
+
+
+def _build_static_geonode_settings():
+    server_local_config = getattr(settings, "MAPSTORE_SERVER_LOCAL_CONFIG", True)
+    return {
         'MAP_BASELAYERS': getattr(settings, "MAPSTORE_BASELAYERS", []),
         'MAP_BASELAYERS_SOURCES': getattr(settings, "MAPSTORE_BASELAYERS_SOURCES", {}),
-        'CATALOGUE_SERVICES': getattr(settings, "MAPSTORE_CATALOGUE_SERVICES", {}),
+        'CATALOGUE_SERVICES': _get_catalogue_services(),
         'CATALOGUE_SELECTED_SERVICE': getattr(settings, "MAPSTORE_CATALOGUE_SELECTED_SERVICE", None),
         'CREATE_LAYER': getattr(settings, "CREATE_LAYER", False),
         'DEFAULT_MAP_CENTER_X': getattr(settings, "DEFAULT_MAP_CENTER_X", 0),
@@ -30,15 +83,15 @@ def resource_urls(request):
         'DEFAULT_MAP_CRS': getattr(settings, "DEFAULT_MAP_CRS", 'EPSG:3857'),
         'DEFAULT_MAP_ZOOM': getattr(settings, "DEFAULT_MAP_ZOOM", 0),
         'DEFAULT_TILE_SIZE': getattr(settings, "DEFAULT_TILE_SIZE", 512),
-        'DATASET_MAX_UPLOAD_SIZE': get_max_upload_size("dataset_upload_size"),
-        'DOCUMENT_MAX_UPLOAD_SIZE': get_max_upload_size("document_upload_size"),
         'DEFAULT_LAYER_FORMAT': getattr(settings, "DEFAULT_LAYER_FORMAT", 'image/png'),
-        'MAX_PARALLEL_UPLOADS': get_max_upload_parallelism_limit("default_max_parallel_uploads"),
         'ALLOWED_DOCUMENT_TYPES': getattr(settings, "ALLOWED_DOCUMENT_TYPES", []),
         'LANGUAGES': getattr(settings, "LANGUAGES", []),
-        'TRANSLATIONS_PATH': getattr(settings, "MAPSTORE_TRANSLATIONS_PATH", ['/static/mapstore/ms-translations', '/static/mapstore/gn-translations']),
+        'TRANSLATIONS_PATH': _get_translations_path(),
         'PROJECTION_DEFS': getattr(settings, "MAPSTORE_PROJECTION_DEFS", []),
-        'PLUGINS_CONFIG_PATCH_RULES': getattr(settings, "MAPSTORE_PLUGINS_CONFIG_PATCH_RULES", []),
+        'PLUGINS_CONFIG_PATCH_RULES': get_plugins_config_patch_rules(),
+        'LOCAL_CONFIG_URL': reverse('mapstore_local_config') if server_local_config else None,
+        'LOCAL_CONFIG_PATCH_RULES': split_plugins_config_patch_rules(get_plugins_config_patch_rules())[1],
+        'INLINE_LOCAL_CONFIG': server_local_config and getattr(settings, "MAPSTORE_INLINE_LOCAL_CONFIG", False),
         'EXTENSIONS_FOLDER_PATH': getattr(settings, "MAPSTORE_EXTENSIONS_FOLDER_PATH", '/static/mapstore/extensions/'),
         'TIME_ENABLED': getattr(
                 settings,
@@ -58,4 +111,104 @@ def resource_urls(request):
                         False),
         'SUPPORTED_DATASET_FILE_TYPES': get_supported_datasets_file_types()
     }
+
+
+def get_static_geonode_settings():
+    """
+    Values of GEONODE_SETTINGS depending only on settings.py,
+    computed once per process
+    """
+    if _geonode_settings_cache['static'] is None:
+        _geonode_settings_cache['static'] = _build_static_geonode_settings()
+    return _geonode_settings_cache['static']
+
+
+def get_upload_limits():
+    """
+    Values of GEONODE_SETTINGS stored in the database,
+    cached until the upload size or parallelism limits change
+    """
+    upload_limits = cache.get(UPLOAD_LIMITS_CACHE_KEY)
+    if upload_limits is None:
+        upload_limits = {
+            'DATASET_MAX_UPLOAD_SIZE': get_max_upload_size("dataset_upload_size"),
+            'DOCUMENT_MAX_UPLOAD_SIZE': get_max_upload_size("document_upload_size"),
+            'MAX_PARALLEL_UPLOADS': get_max_upload_parallelism_limit("default_max_parallel_uploads")
+        }
+        cache.set(
+            UPLOAD_LIMITS_CACHE_KEY,
+            upload_limits,
+            getattr(settings, 'MAPSTORE_UPLOAD_LIMITS_CACHE_TIMEOUT', 60 * 60)
+        )
+    return upload_limits
+
+
+def invalidate_upload_limits_cache(*args, **kwargs):
+    cache.delete(UPLOAD_LIMITS_CACHE_KEY)
+
+
+def invalidate_geonode_settings_cache(*args, **kwargs):
+    with _lock:
+        _geonode_settings_cache.update({
+            'static': None,
+            'upload_limits': None,
+            'settings': None,
+            'json_script': None
+        })
+    invalidate_upload_limits_cache()
+
+
+def _get_cached_geonode_settings():
+    upload_limits = get_upload_limits()
+    with _lock:
+        if upload_limits != _geonode_settings_cache['upload_limits']:
+            geonode_settings = {
+                **get_static_geonode_settings(),
+                **upload_limits
+            }
+            _geonode_settings_cache.update({
+                'upload_limits': upload_limits,
+                'settings': geonode_settings,
+                'json_script': json_script(geonode_settings, 'GEONODE_SETTINGS')
+            })
+        return _geonode_settings_cache
+
+
+@instrument('geonode_settings')
+def get_geonode_settings():
+    return _get_cached_geonode_settings()['settings']
+
+
+@instrument('geonode_settings_json_script')
+def get_geonode_settings_json_script():
+    """
+    GEONODE_SETTINGS already serialized as json_script tag,
+    it's reused until one of the settings values change
+    """
+    return _get_cached_geonode_settings()['json_script']
+
+
+def _lazy(func):
+    """
+    Templates call callable variables when resolving them,
+    so the value is computed only if a template uses it
+    and it's memoized for the rest of the render
+    """
+    value = []
+
+    def get_value():
+        if not value:
+            value.append(func())
+        return value[0]
+    return get_value
+
+
+@instrument('resource_urls')
+def resource_urls(request):
+    """Global values to pass to templates"""
+    defaults = dict(
+        GEOAPPS = ['GeoStory', 'GeoDashboard']
+    )
+    defaults['GEONODE_SETTINGS'] = _lazy(get_geonode_settings)
+    defaults['GEONODE_SETTINGS_JSON_SCRIPT'] = _lazy(get_geonode_settings_json_script)
     return defaults
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import json
+import uuid
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+GEOSTORY_VERSION_CACHE_KEY = 'geonode_mapstore_client.geostory_version.{}'
+GEOSTORY_SLICE_CACHE_KEY = 'geonode_mapstore_client.geostory.{}.{}.{}'
+SKELETON_SLICE = 'skeleton'
+
+
+def _get_geostory_cache_timeout():
+    return getattr(settings, 'MAPSTORE_GEOSTORY_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def get_geostory_version(pk):
+    key = GEOSTORY_VERSION_CACHE_KEY.format(pk)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def invalidate_geostories_cache(pks):
+    """
+    Change the version included in the keys of the cached slices of the geostories,
+    used after the blobs are written without the save signals (QuerySet.update, bulk_update)
+    """
+    if pks:
+        cache.set_many({GEOSTORY_VERSION_CACHE_KEY.format(pk): uuid.uuid4().hex for pk in pks}, None)
+
+
+def invalidate_geostory_cache(sender, instance, **kwargs):
+    """
+    Change the version included in the keys of the cached slices of the saved geostory
+    """
+    if getattr(instance, 'resource_type', None) == 'geostory':
+        invalidate_geostories_cache([instance.pk])
+
+
+def _collect_resource_ids(value, ids):
+    if isinstance(value, dict):
+        resource_id = value.get('resourceId')
+        if resource_id is not None:
+            ids.add(resource_id)
+        for item in value.values():
+            _collect_resource_ids(item, ids)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_resource_ids(item, ids)
+    return ids
+
+
+def _get_section_resources(section, resources):
+    ids = _collect_resource_ids(section, set())
+    return [resource for resource in resources if resource.get('id') in ids]
+
+
+def _slice(content):
+    content = json.dumps(content, separators=(',', ':')).encode('utf-8')
+    return {
+        'content': content,
+        'etag': hashlib.md5(content).hexdigest()
+    }
+
+
+def split_geostory(story):
+    """
+    Split a geostory in the skeleton, with the list of the sections and the content of the first one,
+    and in the slices of each section with the resources it references
+    """
+    story = story if isinstance(story, dict) else {}
+    sections = [section for section in story.get('sections', []) if isinstance(section, dict)]
+    resources = [resource for resource in story.get('resources', []) if isinstance(resource, dict)]
+    slices = {}
+    for section in sections:
+        slices[str(section.get('id'))] = _slice({
+            'section': section,
+            'resources': _get_section_resources(section, resources)
+        })
+    skeleton = {
+        **{key: value for key, value in story.items() if key not in ('sections', 'resources')},
+        'sections': [
+            {
+                'id': section.get('id'),
+                'type': section.get('type'),
+                'title': section.get('title')
+            }
+            for section in sections
+        ],
+        'firstSection': sections[0] if sections else None,
+        'resources': _get_section_resources(sections[0], resources) if sections else []
+    }
+    slices[SKELETON_SLICE] = _slice(skeleton)
+    return slices
+
+
+def get_geostory_slice(pk, name, load_story):
+    """
+    Return the cached content and ETag of the skeleton or of a section of a geostory,
+    all the slices are rebuilt from the story returned by load_story when one is missing.
+    None if the section does not exist
+    """
+    version = get_geostory_version(pk)
+    key = GEOSTORY_SLICE_CACHE_KEY.format(pk, version, name)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached or None
+    slices = split_geostory(load_story())
+    timeout = _get_geostory_cache_timeout()
+    cache.set_many({
+        GEOSTORY_SLICE_CACHE_KEY.format(pk, version, slice_name): value
+        for slice_name, value in slices.items()
+    }, timeout)
+    if name not in slices:
+        # avoid to rebuild the slices for unknown sections
+        cache.set(key, {}, timeout)
+    return slices.get(name)
@@ -14,8 +14,54 @@ try:
 except ImportError:
     from django.utils import simplejson as json
 
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import Http404
+
 from geonode.client.hooksets import BaseHookSet
 from geonode.base.models import ResourceBase
+from geonode.layers.models import Dataset
+
+from geonode_mapstore_client.request_cache import request_cached
+
+DATASET_LOOKUP_CACHE_KEY = 'geonode_mapstore_client.dataset_lookup.{}'
+
+
+def _get_dataset_lookup_cache_key(identifier):
+    return DATASET_LOOKUP_CACHE_KEY.format(hashlib.md5(identifier.encode('utf-8')).hexdigest())
+
+
+def get_dataset_id_and_type(identifier):
+    """
+    Return the id and the resource type of the dataset with the given alternate or typename
+    with a single query, None if there is no exact match. The result is kept in the Django cache
+    """
+    key = _get_dataset_lookup_cache_key(identifier)
+    resource = cache.get(key)
+    if resource is not None:
+        return resource
+    matches = Dataset.objects \
+        .filter(Q(alternate=identifier) | Q(typename=identifier)) \
+        .values_list('id', 'resource_type', 'alternate')
+    # the alternate is preferred as in the dataset views
+    matches = sorted(matches, key=lambda match: match[2] != identifier)
+    if not matches:
+        return None
+    resource = matches[0][:2]
+    cache.set(key, resource, getattr(settings, 'MAPSTORE_RESOURCE_LOOKUP_CACHE_TIMEOUT', 60 * 60))
+    return resource
+
+
+def invalidate_dataset_lookup_cache(sender, instance, **kwargs):
+    cache.delete_many([
+        _get_dataset_lookup_cache_key(identifier)
+        for identifier in (instance.alternate, instance.typename)
+        if identifier
+    ])
+
 
 def resource_list_url(resource_type):
     return '/catalogue/#/search/?filter{resource_type.in}' + '={}'.format(resource_type)
@@ -24,6 +70,20 @@ def resource_detail_url(resource_type, resource_id):
     return '/catalogue/#/{}/{}'.format(resource_type, resource_id)
 
 
+def _typed_detail_urls(resource_type, resources):
+    """
+    Detail urls of a list of resources of the same type, the prefix is formatted once
+    """
+    prefix = '/catalogue/#/{}/'.format(resource_type)
+    return [prefix + str(resource.id) for resource in resources]
+
+
+DATASET_LIST_URL = resource_list_url('dataset')
+MAP_LIST_URL = resource_list_url('map')
+DOCUMENT_LIST_URL = resource_list_url('document')
+GEOAPP_LIST_URL = resource_list_url('geostory')
+
+
 class MapStoreHookSet(BaseHookSet):
 
     def get_request(self, context):
@@ -35,15 +95,21 @@ class MapStoreHookSet(BaseHookSet):
     def isEditDataset(self, context):
         if context:
             req = self.get_request(context)
-            if req.GET.get("layer") and req.GET.get("subtype"):
-                return True
+            return request_cached(
+                req,
+                'is_edit_dataset',
+                lambda: bool(req.GET.get("layer") and req.GET.get("subtype"))
+            )
         return False
 
     def isViewDataset(self, context):
         if context:
             req = self.get_request(context)
-            if req.GET.get("layer") and req.GET.get("view"):
-                return True
+            return request_cached(
+                req,
+                'is_view_dataset',
+                lambda: bool(req.GET.get("layer") and req.GET.get("view"))
+            )
         return False
 
     # Layers
@@ -73,7 +139,7 @@ class MapStoreHookSet(BaseHookSet):
         return 'geonode-mapstore-client/legacy/dataset_style_edit.html'
 
     def dataset_list_url(self):
-        return resource_list_url('dataset')
+        return DATASET_LIST_URL
 
     def dataset_upload_url(self):
         return '/catalogue/#/upload/dataset'
@@ -81,6 +147,9 @@ class MapStoreHookSet(BaseHookSet):
     def dataset_detail_url(self, resource):
         return resource_detail_url('dataset', resource.id)
 
+    def dataset_detail_urls(self, resources):
+        return _typed_detail_urls('dataset', resources)
+
     # Maps
     def map_detail_template(self, context=None):
         return 'geonode-mapstore-client/legacy/map_detail.html'
@@ -103,21 +172,27 @@ class MapStoreHookSet(BaseHookSet):
         return 'geonode-mapstore-client/map_embed.html'
 
     def map_list_url(self):
-        return resource_list_url('map')
+        return MAP_LIST_URL
 
     def map_detail_url(self, resource):
         return resource_detail_url('map', resource.id)
 
+    def map_detail_urls(self, resources):
+        return _typed_detail_urls('map', resources)
+
     # def map_download_template(self, context=None):
     #    return 'geonode-mapstore-client/legacy/map_view.html'
 
     # Documents
     def document_list_url(self):
-        return resource_list_url('document')
+        return DOCUMENT_LIST_URL
 
     def document_detail_url(self, resource):
         return resource_detail_url('document', resource.id)
 
+    def document_detail_urls(self, resources):
+        return _typed_detail_urls('document', resources)
+
     # GeoApps
     def geoapp_list_template(self, context=None):
         return 'geonode-mapstore-client/legacy/app_list.html'
@@ -145,11 +220,21 @@ class MapStoreHookSet(BaseHookSet):
         return 'geonode-mapstore-client/legacy/app_download.html'
 
     def geoapp_list_url(self):
-        return resource_list_url('geostory')
+        return GEOAPP_LIST_URL
 
     def geoapp_detail_url(self, resource):
         return resource_detail_url(resource.resource_type, resource.id)
 
+    def geoapp_detail_urls(self, resources):
+        # geoapps of a page can have different resource types
+        return self.resource_detail_urls(resources)
+
+    def resource_detail_urls(self, resources):
+        """
+        Detail urls of a page of resources of any type, in the same order of the resources
+        """
+        return [resource_detail_url(resource.resource_type, resource.id) for resource in resources]
+
     # Map Persisting
     def viewer_json(self, conf, context=None):
         context['viewer'] = conf
@@ -164,14 +249,13 @@ class MapStoreHookSet(BaseHookSet):
         url = url.replace('/metadata', '')
         resource_identifier = url.split('/')[-1]
         try:
-            resource = ResourceBase.objects.get(id=int(resource_identifier))
+            resource = ResourceBase.objects \
+                .filter(id=int(resource_identifier)) \
+                .values_list('id', 'resource_type') \
+                .first()
         except ValueError:
-            from geonode.layers.views import _resolve_dataset
-            resource = _resolve_dataset(
-                request,
-                resource_identifier,
-                'base.change_resourcebase',
-                'Not allowed')
-        resource_identifier = resource.id
-        resource_type = resource.resource_type
+            resource = get_dataset_id_and_type(resource_identifier)
+        if not resource:
+            raise Http404(f'Resource {resource_identifier} not found')
+        resource_identifier, resource_type = resource
         return resource_detail_url(resource_type, resource_identifier)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import re
+import base64
+import hashlib
+import logging
+import binascii
+import mimetypes
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+INLINE_MEDIA_FOLDER = 'mapstore/inline-media'
+DATA_URL_REGEX = re.compile(
+    r'data:(?P<mime>[\w.+-]+/[\w.+-]+)(?:;[\w.+-]+=[\w.+-]+)*;base64,(?P<data>[A-Za-z0-9+/=]+)'
+)
+# the media types served from the media storage, svg is excluded because it can contain scripts
+INLINE_MEDIA_TYPES = ('image/', 'video/', 'audio/')
+EXCLUDED_INLINE_MEDIA_TYPES = ('image/svg+xml',)
+
+
+def is_inline_media_extraction_enabled():
+    return getattr(settings, 'MAPSTORE_EXTRACT_INLINE_MEDIA', False)
+
+
+def _get_min_size():
+    return getattr(settings, 'MAPSTORE_INLINE_MEDIA_MIN_SIZE', 1024)
+
+
+def _is_extractable(mime, data):
+    return len(data) >= _get_min_size() \
+        and mime.lower().startswith(INLINE_MEDIA_TYPES) \
+        and mime.lower() not in EXCLUDED_INLINE_MEDIA_TYPES
+
+
+def store_inline_media(mime, content):
+    """
+    Save the content in the media storage with its sha256 as name and return its url,
+    the same content is stored only once
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    extension = mimetypes.guess_extension(mime) or ''
+    path = f'{INLINE_MEDIA_FOLDER}/{digest[:2]}/{digest}{extension}'
+    if not default_storage.exists(path):
+        saved_path = default_storage.save(path, ContentFile(content))
+        if saved_path != path:
+            # stored concurrently by another process
+            default_storage.delete(saved_path)
+    return default_storage.url(path)
+
+
+def _replace_data_url(match, stats, store):
+    mime, data = match.group('mime'), match.group('data')
+    if not _is_extractable(mime, data):
+        return match.group(0)
+    try:
+        content = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        return match.group(0)
+    url = store(mime, content)
+    stats['extracted'] += 1
+    stats['bytes'] += len(data)
+    return url
+
+
+def extract_inline_media(value, stats=None, store=store_inline_media):
+    """
+    Replace the base64 data urls in the strings of a json value with the urls returned by store,
+    the same object is returned when nothing is replaced
+    """
+    stats = stats if stats is not None else {'extracted': 0, 'bytes': 0}
+    if isinstance(value, str):
+        if ';base64,' not in value:
+            return value
+        replaced = DATA_URL_REGEX.sub(lambda match: _replace_data_url(match, stats, store), value)
+        return replaced if replaced != value else value
+    if isinstance(value, dict):
+        items = {key: extract_inline_media(item, stats, store) for key, item in value.items()}
+        changed = any(items[key] is not item for key, item in value.items())
+        return items if changed else value
+    if isinstance(value, list):
+        items = [extract_inline_media(item, stats, store) for item in value]
+        changed = any(new is not old for new, old in zip(items, value))
+        return items if changed else value
+    return value
+
+
+def extract_resource_inline_media(resource, stats=None, store=store_inline_media):
+    """
+    Extract the inline media of the loaded blob and thumbnail url of a resource,
+    return the names of the changed fields
+    """
+    changed = []
+    for field in ('blob', 'thumbnail_url'):
+        if field not in resource.__dict__:
+            continue
+        value = resource.__dict__[field]
+        extracted = extract_inline_media(value, stats, store)
+        if extracted is not value:
+            setattr(resource, field, extracted)
+            changed.append(field)
+    return changed
+
+
+def extract_inline_media_on_save(sender, instance, **kwargs):
+    if not is_inline_media_extraction_enabled():
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not {'blob', 'thumbnail_url'} & set(update_fields):
+        return
+    try:
+        extract_resource_inline_media(instance)
+    except Exception as e:
+        # the resource is saved with the inline media
+        logger.error(f'Failed to extract the inline media of resource {instance.pk}: {e}')
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import time
+import threading
+import contextvars
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+
+METRICS_PREFIX = 'geonode_mapstore_client'
+
+# name -> calls, seconds and queries recorded by this process
+_metrics = {}
+_metrics_lock = threading.Lock()
+# name -> calls, seconds and queries of the current request, set by the middleware
+_request_timings = contextvars.ContextVar('mapstore_request_timings', default=None)
+
+
+def is_instrumentation_enabled():
+    return getattr(settings, 'MAPSTORE_INSTRUMENTATION', False)
+
+
+class _QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _add(timings, name, seconds, queries):
+    entry = timings.setdefault(name, [0, 0.0, 0])
+    entry[0] += 1
+    entry[1] += seconds
+    entry[2] += queries
+
+
+def record(name, seconds, queries=0):
+    with _metrics_lock:
+        _add(_metrics, name, seconds, queries)
+    timings = _request_timings.get()
+    if timings is not None:
+        _add(timings, name, seconds, queries)
+
+
+def instrument(name):
+    """
+    Record wall time and database queries of every call of the decorated function
+    when MAPSTORE_INSTRUMENTATION is enabled
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_instrumentation_enabled():
+                return func(*args, **kwargs)
+            counter = _QueryCounter()
+            start = time.perf_counter()
+            try:
+                with connection.execute_wrapper(counter):
+                    return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start, counter.count)
+        return wrapper
+    return decorator
+
+
+def get_metrics():
+    with _metrics_lock:
+        return {
+            name: {
+                'calls': calls,
+                'seconds': seconds,
+                'queries': queries
+            }
+            for name, (calls, seconds, queries) in _metrics.items()
+        }
+
+
+def _format_counter(lines, metric, help_text, values):
+    lines.append(f'# HELP {METRICS_PREFIX}_{metric} {help_text}')
+    lines.append(f'# TYPE {METRICS_PREFIX}_{metric} counter')
+    for name, value in values:
+        lines.append(f'{METRICS_PREFIX}_{metric}{{name="{name}"}} {value}')
+
+
+def format_prometheus_metrics(extra_metrics=None):
+    """
+    Text exposition format of the recorded metrics,
+    extra_metrics is a dictionary of additional gauges
+    """
+    metrics = sorted(get_metrics().items())
+    lines = []
+    _format_counter(lines, 'calls_total', 'Calls of the instrumented function.',
+                    [(name, value['calls']) for name, value in metrics])
+    _format_counter(lines, 'seconds_total', 'Wall time spent in the instrumented function.',
+                    [(name, f"{value['seconds']:.6f}") for name, value in metrics])
+    _format_counter(lines, 'queries_total', 'Database queries executed by the instrumented function.',
+                    [(name, value['queries']) for name, value in metrics])
+    for metric, value in sorted((extra_metrics or {}).items()):
+        lines.append(f'# TYPE {METRICS_PREFIX}_{metric} gauge')
+        lines.append(f'{METRICS_PREFIX}_{metric} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def format_server_timing(timings):
+    return ', '.join(
+        f'{name};desc="{calls} calls, {queries} queries";dur={seconds * 1000:.2f}'
+        for name, (calls, seconds, queries) in timings.items()
+    )
+
+
+class InstrumentationMiddleware:
+    """
+    Add the Server-Timing header with the instrumented functions called by the request
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_instrumentation_enabled():
+            return self.get_response(request)
+        timings = {}
+        token = _request_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timings.reset(token)
+        if timings:
+            response['Server-Timing'] = format_server_timing(timings)
+        return response
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import json
+import copy
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+
+from geonode_mapstore_client.templatetags.client_version import get_static_file_content
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CONFIG_PATH = 'mapstore/configs/localConfig.json'
+SERVER_PATCH_OPERATIONS = ('add', 'remove', 'replace')
+
+_cache = {
+    'local_config': None,
+    'rules_hash': None,
+    'content': None,
+    'etag': None
+}
+_lock = threading.Lock()
+
+
+def get_plugins_config_patch_rules():
+    return getattr(settings, "MAPSTORE_PLUGINS_CONFIG_PATCH_RULES", [])
+
+
+def split_plugins_config_patch_rules(rules):
+    """
+    Split the patch rules in the ones applied by the server and the ones left to the client.
+    Only json pointers are supported by the server, jsonpath expressions
+    and all the rules following them are applied by the client to preserve the order
+    """
+    for index, rule in enumerate(rules):
+        path = rule.get('jsonpath', rule.get('path'))
+        if rule.get('op') not in SERVER_PATCH_OPERATIONS \
+                or not isinstance(path, str) \
+                or not (path == '' or path.startswith('/')):
+            return rules[:index], rules[index:]
+    return rules, []
+
+
+def _parse_pointer(pointer):
+    if pointer == '':
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _get_list_index(target, token, op):
+    if token == '-' and op == 'add':
+        return len(target)
+    index = int(token)
+    if index < 0 or index > len(target) or (op != 'add' and index == len(target)):
+        raise IndexError(f'index {token} out of range')
+    return index
+
+
+def apply_patch_rule(document, rule):
+    """
+    Apply an add, remove or replace json patch operation and return the patched document
+    """
+    op = rule['op']
+    tokens = _parse_pointer(rule.get('jsonpath', rule.get('path')))
+    if not tokens:
+        return None if op == 'remove' else copy.deepcopy(rule.get('value'))
+    target = document
+    for token in tokens[:-1]:
+        target = target[_get_list_index(target, token, None)] if isinstance(target, list) else target[token]
+    key = tokens[-1]
+    if isinstance(target, list):
+        index = _get_list_index(target, key, op)
+        if op == 'add':
+            target.insert(index, copy.deepcopy(rule.get('value')))
+        elif op == 'remove':
+            del target[index]
+        else:
+            target[index] = copy.deepcopy(rule.get('value'))
+    else:
+        if op == 'remove':
+            del target[key]
+        elif op == 'replace' and key not in target:
+            raise KeyError(key)
+        else:
+            target[key] = copy.deepcopy(rule.get('value'))
+    return document
+
+
+def patch_local_config(local_config, rules):
+    local_config = copy.deepcopy(local_config)
+    plugins = local_config.get('plugins')
+    for rule in rules:
+        try:
+            plugins = apply_patch_rule(plugins, rule)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.error(f'Failed to apply the plugins config patch rule {rule}: {e}')
+    local_config['plugins'] = plugins
+    return local_config
+
+
+def get_patched_local_config():
+    """
+    Return the minified localConfig with the server side patch rules applied and its ETag,
+    the result is kept in memory until the localConfig file or the patch rules change
+    """
+    local_config = get_static_file_content(LOCAL_CONFIG_PATH, parse=json.load, default=None)
+    if local_config is None:
+        return None, None
+    server_rules, _ = split_plugins_config_patch_rules(get_plugins_config_patch_rules())
+    rules_hash = hashlib.md5(json.dumps(server_rules, sort_keys=True).encode()).hexdigest()
+    with _lock:
+        if local_config is not _cache['local_config'] or rules_hash != _cache['rules_hash']:
+            content = json.dumps(patch_local_config(local_config, server_rules), separators=(',', ':'))
+            _cache.update({
+                'local_config': local_config,
+                'rules_hash': rules_hash,
+                'content': content,
+                'etag': hashlib.md5(content.encode()).hexdigest()
+            })
+        return _cache['content'], _cache['etag']
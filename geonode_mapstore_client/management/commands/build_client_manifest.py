@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from geonode_mapstore_client.templatetags.client_version import MANIFEST_PATH, VERSION_PATH
+
+DIST_PATH = 'mapstore/dist'
+# entry bundles and themes loaded by the templates with client_asset,
+# the chunks are already named with the webpack build hash
+HASHED_ASSET_REGEX = re.compile(r'^mapstore/dist/(js/[^/]+\.js|themes/[^/]+\.css)$')
+CHUNK_SUFFIX = '.chunk.js'
+COMPRESSED_EXTENSIONS = ('.js', '.css', '.json', '.svg', '.html', '.txt', '.xml', '.ttf', '.eot')
+HASH_LENGTH = 12
+HASHED_FILE_REGEX = re.compile(r'\.[0-9a-f]{%d}\.[^.]+$' % HASH_LENGTH)
+
+
+def get_file_hash(file_path):
+    file_hash = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(64 * 1024), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()[:HASH_LENGTH]
+
+
+def get_hashed_path(path, file_hash):
+    name, ext = os.path.splitext(path)
+    return f'{name}.{file_hash}{ext}'
+
+
+def write_compressed_siblings(file_path, use_brotli=True):
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    written = []
+    gzip_path = f'{file_path}.gz'
+    with open(gzip_path, 'wb') as f:
+        f.write(gzip.compress(content, compresslevel=9))
+    written.append(gzip_path)
+    if use_brotli and brotli:
+        brotli_path = f'{file_path}.br'
+        with open(brotli_path, 'wb') as f:
+            f.write(brotli.compress(content))
+        written.append(brotli_path)
+    return written
+
+
+class Command(BaseCommand):
+
+    help = 'Write content hashed and precompressed copies of the MapStore dist assets and their manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--static-root',
+            dest='static_root',
+            default=None,
+            help='Folder containing the collected static files (default: STATIC_ROOT)')
+        parser.add_argument(
+            '--min-size',
+            dest='min_size',
+            type=int,
+            default=1024,
+            help='Minimum size in bytes of the compressed assets (default: 1024)')
+        parser.add_argument(
+            '--no-brotli',
+            dest='no_brotli',
+            action='store_true',
+            default=False,
+            help='Write only the gzip compressed copies')
+
+    def _iter_assets(self, dist_root):
+        for root, dirs, files in os.walk(dist_root):
+            for file_name in files:
+                # skip files written by previous runs
+                if file_name.endswith(('.gz', '.br', '.tmp')) or HASHED_FILE_REGEX.search(file_name):
+                    continue
+                if file_name == os.path.basename(MANIFEST_PATH):
+                    continue
+                yield os.path.join(root, file_name)
+
+    def handle(self, **options):
+        static_root = options.get('static_root') or settings.STATIC_ROOT
+        min_size = options.get('min_size')
+        use_brotli = not options.get('no_brotli')
+        dist_root = os.path.join(static_root, DIST_PATH)
+        if not os.path.isdir(dist_root):
+            raise CommandError(f'{dist_root} does not exist, run collectstatic first')
+        if use_brotli and not brotli:
+            self.stdout.write('brotli is not installed, only gzip copies will be written')
+
+        version = ''
+        version_path = os.path.join(static_root, VERSION_PATH)
+        if os.path.exists(version_path):
+            with open(version_path, 'r') as f:
+                version = f.read().strip()
+
+        files = {}
+        compressed = 0
+        for file_path in self._iter_assets(dist_root):
+            path = os.path.relpath(file_path, static_root).replace(os.sep, '/')
+            to_compress = [file_path]
+            if HASHED_ASSET_REGEX.match(path) and not path.endswith(CHUNK_SUFFIX):
+                hashed_path = get_hashed_path(path, get_file_hash(file_path))
+                hashed_file_path = os.path.join(static_root, hashed_path)
+                if not os.path.exists(hashed_file_path):
+                    shutil.copy2(file_path, hashed_file_path)
+                files[path] = hashed_path
+                to_compress.append(hashed_file_path)
+            if path.endswith(COMPRESSED_EXTENSIONS) and os.path.getsize(file_path) >= min_size:
+                for compress_path in to_compress:
+                    compressed += len(write_compressed_siblings(compress_path, use_brotli))
+
+        manifest_file_path = os.path.join(static_root, MANIFEST_PATH)
+        tmp_manifest_file_path = f'{manifest_file_path}.tmp'
+        with open(tmp_manifest_file_path, 'w') as f:
+            json.dump({'version': version, 'files': files}, f, indent=2, sort_keys=True)
+        os.replace(tmp_manifest_file_path, manifest_file_path)
+        self.stdout.write(
+            f'{len(files)} hashed assets and {compressed} compressed copies written, '
+            f'manifest saved in {manifest_file_path}'
+        )
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from geonode_mapstore_client.blobs import COMPACT_BLOB_KEY, compact_blob, expand_blob, is_blob_compaction_enabled
+from geonode_mapstore_client.geostory import invalidate_geostories_cache
+from geonode_mapstore_client.inline_media import extract_resource_inline_media, store_inline_media
+
+RESOURCE_TYPES = ['map', 'geostory', 'dashboard']
+
+
+class Command(BaseCommand):
+
+    help = 'Move the base64 data urls of the blobs and thumbnails of the resources to files in the media storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-t',
+            '--resource-type',
+            dest='resource_types',
+            action='append',
+            choices=RESOURCE_TYPES,
+            help='Resource type to process, it can be repeated (default: all)')
+        parser.add_argument(
+            '-c',
+            '--chunk-size',
+            dest='chunk_size',
+            type=int,
+            default=100,
+            help='Number of resources read and written together (default: 100)')
+        parser.add_argument(
+            '--dry-run',
+            dest='dry_run',
+            action='store_true',
+            default=False,
+            help='Report the inline media to move without storing them or updating the resources')
+
+    def _write_resources(self, model, resources, dry_run):
+        if not resources or dry_run:
+            return
+        fields = sorted({field for _, changed in resources for field in changed})
+        for resource, _ in resources:
+            if 'blob' in fields and is_blob_compaction_enabled():
+                resource.blob = compact_blob(resource.blob, resource.resource_type)
+        with transaction.atomic():
+            model.objects.bulk_update([resource for resource, _ in resources], fields)
+        # bulk_update does not send the save signals that invalidate the cached geostory slices
+        invalidate_geostories_cache([resource.pk for resource, _ in resources if resource.resource_type == 'geostory'])
+
+    def handle(self, **options):
+        from geonode.base.models import ResourceBase
+
+        resource_types = options.get('resource_types') or RESOURCE_TYPES
+        chunk_size = max(options.get('chunk_size'), 1)
+        dry_run = options.get('dry_run')
+
+        # compressed blobs cannot be filtered by content
+        inline_blob = Q(blob__icontains=';base64,') | Q(blob__has_key=COMPACT_BLOB_KEY)
+        queryset = ResourceBase.objects \
+            .non_polymorphic() \
+            .filter(resource_type__in=resource_types) \
+            .filter(inline_blob | Q(thumbnail_url__startswith='data:')) \
+            .only('id', 'resource_type', 'blob', 'thumbnail_url') \
+            .order_by('id')
+
+        # nothing is stored in the media storage on dry runs
+        store = (lambda mime, content: '') if dry_run else store_inline_media
+        stats = {'extracted': 0, 'bytes': 0}
+        processed = 0
+        updated = 0
+        start = time.perf_counter()
+        changed_resources = []
+        # the resources are released after each chunk to keep the memory flat
+        for resource in queryset.iterator(chunk_size=chunk_size):
+            processed += 1
+            resource.blob = expand_blob(resource.blob)
+            changed = extract_resource_inline_media(resource, stats, store)
+            if changed:
+                updated += 1
+                changed_resources.append((resource, changed))
+            if len(changed_resources) >= chunk_size:
+                self._write_resources(ResourceBase, changed_resources, dry_run)
+                changed_resources = []
+                self.stdout.write(f'{processed} processed, {updated} updated')
+        self._write_resources(ResourceBase, changed_resources, dry_run)
+
+        if dry_run:
+            self.stdout.write('Dry run, nothing has been written')
+        self.stdout.write(
+            f'{processed} processed, {updated} updated, {stats["extracted"]} inline media moved '
+            f'({stats["bytes"] / 1024 / 1024:.1f} MB of base64) in {time.perf_counter() - start:.1f}s'
+        )
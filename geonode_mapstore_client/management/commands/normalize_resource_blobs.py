@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from geonode_mapstore_client.blobs import compact_blob, expand_blob, is_blob_compaction_enabled, is_compact_blob
+from geonode_mapstore_client.geostory import invalidate_geostories_cache
+
+# the decoding used to move the blobs out of the mapstore2_adapter tables
+decode_attribute_value = import_module(
+    'geonode_mapstore_client.migrations.0002_migrate_map_blob'
+).decode_attribute_value
+
+RESOURCE_TYPES = ['map', 'geostory', 'dashboard']
+# maximum number of nested encodings removed from a blob
+MAX_DECODE_DEPTH = 3
+
+UNCHANGED = 'unchanged'
+NORMALIZED = 'normalized'
+INVALID = 'invalid'
+
+
+def normalize_blob(blob):
+    """
+    Return the blob as a dictionary decoding base64 literals and json strings,
+    None if the blob cannot be converted to a dictionary
+    """
+    value = blob
+    for _ in range(MAX_DECODE_DEPTH):
+        if isinstance(value, dict):
+            return value
+        if not isinstance(value, str):
+            return None
+        value = decode_attribute_value(value)
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                return None
+    return value if isinstance(value, dict) else None
+
+
+def normalize_blobs(rows, compact=False):
+    """
+    Normalize a list of (id, resource_type, blob) tuples with the blobs as stored in the database
+    and store them in the compact or in the expanded format, the results are (id, resource_type, status, blob) tuples.
+    It runs inside the worker processes so it must not access the database
+    """
+    results = []
+    for resource_id, resource_type, blob in rows:
+        if blob is None:
+            results.append((resource_id, resource_type, UNCHANGED, None))
+            continue
+        expanded = expand_blob(blob)
+        normalized = normalize_blob(expanded)
+        if normalized is None:
+            results.append((resource_id, resource_type, INVALID, None))
+            continue
+        if compact and is_compact_blob(blob) and normalized == expanded:
+            # already stored in the compact format
+            results.append((resource_id, resource_type, UNCHANGED, None))
+            continue
+        if compact:
+            normalized = compact_blob(normalized, resource_type)
+        if normalized == blob:
+            results.append((resource_id, resource_type, UNCHANGED, None))
+        else:
+            results.append((resource_id, resource_type, NORMALIZED, normalized))
+    return results
+
+
+class Command(BaseCommand):
+
+    help = 'Validate and normalize the blob of maps, geostories and dashboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-t',
+            '--resource-type',
+            dest='resource_types',
+            action='append',
+            choices=RESOURCE_TYPES,
+            help='Resource type to process, it can be repeated (default: all)')
+        parser.add_argument(
+            '-c',
+            '--chunk-size',
+            dest='chunk_size',
+            type=int,
+            default=500,
+            help='Number of resources read, normalized and written together (default: 500)')
+        parser.add_argument(
+            '-w',
+            '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='Number of processes used to normalize the blobs (default: 1)')
+        parser.add_argument(
+            '--compact',
+            dest='compact',
+            action='store_true',
+            default=False,
+            help='Store the blobs without the default values and compress the large ones, '
+                 'it is the default when MAPSTORE_COMPACT_BLOBS is enabled. '
+                 'Otherwise the compact blobs are expanded')
+        parser.add_argument(
+            '--dry-run',
+            dest='dry_run',
+            action='store_true',
+            default=False,
+            help='Report the blobs to normalize without writing them')
+
+    def _iter_chunks(self, queryset, chunk_size):
+        chunk = []
+        for row in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _write_results(self, model, results, stats, dry_run):
+        to_update = []
+        for resource_id, resource_type, status, blob in results:
+            stats[status] += 1
+            if status == INVALID:
+                self.stderr.write(f'Invalid blob for resource {resource_id}')
+            elif status == NORMALIZED:
+                to_update.append(model(id=resource_id, resource_type=resource_type, blob=blob))
+        if to_update and not dry_run:
+            with transaction.atomic():
+                model.objects.bulk_update(to_update, ['blob'])
+            # bulk_update does not send the save signals that invalidate the cached geostory slices
+            invalidate_geostories_cache([resource.pk for resource in to_update if resource.resource_type == 'geostory'])
+
+    def _print_stats(self, stats, start):
+        processed = sum(stats.values())
+        elapsed = time.perf_counter() - start
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{processed} processed, {stats[NORMALIZED]} normalized, '
+            f'{stats[UNCHANGED]} unchanged, {stats[INVALID]} invalid '
+            f'in {elapsed:.1f}s ({rate:.1f} resources/s)'
+        )
+
+    def handle(self, **options):
+        from geonode.base.models import ResourceBase
+
+        resource_types = options.get('resource_types') or RESOURCE_TYPES
+        chunk_size = max(options.get('chunk_size'), 1)
+        workers = max(options.get('workers'), 1)
+        dry_run = options.get('dry_run')
+        normalize = partial(normalize_blobs, compact=options.get('compact') or is_blob_compaction_enabled())
+
+        # the values are read as stored, the compact blobs are expanded by normalize_blobs
+        queryset = ResourceBase.objects \
+            .non_polymorphic() \
+            .filter(resource_type__in=resource_types) \
+            .values_list('id', 'resource_type', 'blob') \
+            .order_by('id')
+
+        stats = {UNCHANGED: 0, NORMALIZED: 0, INVALID: 0}
+        start = time.perf_counter()
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        # chunks sent to the pool and not yet written, bounded to keep the memory flat
+        pending = deque()
+        try:
+            for rows in self._iter_chunks(queryset, chunk_size):
+                if executor:
+                    pending.append(executor.submit(normalize, rows))
+                    if len(pending) < workers * 2:
+                        continue
+                    results = pending.popleft().result()
+                else:
+                    results = normalize(rows)
+                self._write_results(ResourceBase, results, stats, dry_run)
+                self._print_stats(stats, start)
+            while pending:
+                self._write_results(ResourceBase, pending.popleft().result(), stats, dry_run)
+                self._print_stats(stats, start)
+        finally:
+            if executor:
+                executor.shutdown()
+
+        if dry_run:
+            self.stdout.write('Dry run, no blob has been written')
+        self._print_stats(stats, start)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.core.management.base import BaseCommand
+
+UPDATED = 'updated'
+SKIPPED = 'skipped'
+MISSING = 'missing'
+FAILED = 'failed'
+
+HEADERS = {
+    "Content-type": "application/json",
+    "Accept": "application/json"
+}
+
+
+class Command(BaseCommand):
+
+    help = 'Set the MapStore visual mode on the default style of the existing datasets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-c',
+            '--chunk-size',
+            dest='chunk_size',
+            type=int,
+            default=500,
+            help='Number of datasets read from the database together (default: 500)')
+        parser.add_argument(
+            '--concurrency',
+            dest='concurrency',
+            type=int,
+            default=8,
+            help='Maximum number of concurrent requests to GeoServer (default: 8)')
+        parser.add_argument(
+            '--checkpoint',
+            dest='checkpoint',
+            default=None,
+            help='File storing the id of the last processed dataset, used to resume an interrupted run')
+        parser.add_argument(
+            '--rest-url',
+            dest='rest_url',
+            default=None,
+            help='GeoServer rest api url (default: the url of the GeoNode GeoServer catalog)')
+        parser.add_argument(
+            '--timeout',
+            dest='timeout',
+            type=float,
+            default=30,
+            help='Timeout in seconds of each request to GeoServer (default: 30)')
+
+    def _read_checkpoint(self, checkpoint):
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint, 'r') as f:
+                return int(f.read().strip() or 0)
+        return 0
+
+    def _write_checkpoint(self, checkpoint, last_id):
+        if checkpoint:
+            tmp_checkpoint = f'{checkpoint}.tmp'
+            with open(tmp_checkpoint, 'w') as f:
+                f.write(str(last_id))
+            os.replace(tmp_checkpoint, checkpoint)
+
+    def _get_style_json(self, session, rest_url, style, timeout):
+        from geonode_mapstore_client.utils import get_style_json_url
+
+        # same lookup of get_dataset_style, the style is searched without workspace as fallback
+        urls = [get_style_json_url(rest_url, style.name, style.workspace)] if style.workspace else []
+        urls.append(get_style_json_url(rest_url, style.name))
+        for url in urls:
+            resp = session.get(url, headers=HEADERS, timeout=timeout)
+            if resp.status_code == 200:
+                return url, resp.json()
+        return None, None
+
+    def _update_dataset(self, session, rest_url, timeout, dataset):
+        from geonode_mapstore_client.utils import (
+            MS_FORCE_VISUAL_STYLE_METADATA,
+            is_style_in_visual_mode
+        )
+
+        style = dataset.default_style
+        if not style:
+            return dataset.id, MISSING, None
+        try:
+            url, style_json = self._get_style_json(session, rest_url, style, timeout)
+            if not url:
+                return dataset.id, MISSING, None
+            if is_style_in_visual_mode(style_json):
+                return dataset.id, SKIPPED, None
+            resp = session.put(url, data=json.dumps(MS_FORCE_VISUAL_STYLE_METADATA), headers=HEADERS, timeout=timeout)
+            if resp.status_code not in (200, 201, 202):
+                return dataset.id, FAILED, f'{resp.status_code}, {resp.text}'
+        except requests.RequestException as e:
+            return dataset.id, FAILED, str(e)
+        except (ValueError, KeyError, AttributeError) as e:
+            # GeoServer error pages are not json and unexpected json lacks the style structure
+            return dataset.id, FAILED, f'invalid style response, {e!r}'
+        return dataset.id, UPDATED, None
+
+    def _print_stats(self, stats, start):
+        processed = sum(stats.values())
+        elapsed = time.perf_counter() - start
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{processed} processed, {stats[UPDATED]} updated, {stats[SKIPPED]} skipped, '
+            f'{stats[MISSING]} without style, {stats[FAILED]} failed '
+            f'in {elapsed:.1f}s ({rate:.1f} datasets/s)'
+        )
+
+    def handle(self, **options):
+        from geonode.layers.models import Dataset
+        from geonode.geoserver.helpers import gs_catalog
+
+        chunk_size = max(options.get('chunk_size'), 1)
+        concurrency = max(options.get('concurrency'), 1)
+        checkpoint = options.get('checkpoint')
+        rest_url = options.get('rest_url') or gs_catalog.service_url
+        timeout = options.get('timeout')
+
+        session = requests.Session()
+        session.auth = (gs_catalog.username, gs_catalog.password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        last_id = self._read_checkpoint(checkpoint)
+        if last_id:
+            self.stdout.write(f'Resuming after dataset {last_id}')
+        datasets = Dataset.objects.select_related('default_style').order_by('id')
+        stats = {UPDATED: 0, SKIPPED: 0, MISSING: 0, FAILED: 0}
+        start = time.perf_counter()
+        update_dataset = partial(self._update_dataset, session, rest_url, timeout)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                chunk = list(datasets.filter(id__gt=last_id)[:chunk_size])
+                if not chunk:
+                    break
+                for dataset_id, status, error in executor.map(update_dataset, chunk):
+                    stats[status] += 1
+                    if error:
+                        self.stderr.write(f'Failed to update the style of dataset {dataset_id}: {error}')
+                last_id = chunk[-1].id
+                self._write_checkpoint(checkpoint, last_id)
+                self._print_stats(stats, start)
+        session.close()
+        self._print_stats(stats, start)
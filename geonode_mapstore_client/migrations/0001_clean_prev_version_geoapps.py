@@ -1,5 +1,6 @@
 import json
 
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.db import migrations
 
@@ -7,13 +8,23 @@ remove_geostories_relation = "DROP TABLE IF EXISTS geoapp_geostories_geostory CA
 remove_dashboards_relation = "DROP TABLE IF EXISTS geoapp_dashboards_dashboard CASCADE;"
 
 def update_geostory_dashboard_data(apps, _):
+    batch_size = getattr(settings, 'MAPSTORE_MIGRATION_BATCH_SIZE', 1000)
     model = apps.get_model('base', 'ResourceBase')
-    for item in model.objects.filter(resource_type__in=['dashboard', 'geostory']):
+    items = model.objects.filter(resource_type__in=['dashboard', 'geostory'])
+    if not items.exists():
+        return
+    rtype = ContentType.objects.get(model="geoapp")
+    items.update(polymorphic_ctype=rtype)
+    to_update = []
+    for item in items.only('id', 'blob').iterator(chunk_size=batch_size):
         if isinstance(item.blob, str):
-            new_blob = json.loads(item.blob)
-            model.objects.filter(id=item.id).update(blob=new_blob)
-        rtype = ContentType.objects.get(model="geoapp")
-        model.objects.filter(id=item.id).update(polymorphic_ctype=rtype)
+            item.blob = json.loads(item.blob)
+            to_update.append(item)
+        if len(to_update) >= batch_size:
+            model.objects.bulk_update(to_update, ['blob'])
+            to_update = []
+    if to_update:
+        model.objects.bulk_update(to_update, ['blob'])
 
 
 class Migration(migrations.Migration):
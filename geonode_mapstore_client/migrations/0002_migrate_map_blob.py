@@ -1,7 +1,13 @@
 # Generated by Django 3.2.13 on 2022-04-28 07:32
 import ast
 import base64
-from django.db import migrations, connections
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, connections, transaction
+
+logger = logging.getLogger(__name__)
 
 
 drop_mapstore2_adapter_mapstoreattribute = "DROP TABLE IF EXISTS mapstore2_adapter_mapstoreattribute CASCADE;"
@@ -9,60 +15,116 @@ drop_mapstore2_adapter_mapstoredata = "DROP TABLE IF EXISTS mapstore2_adapter_ma
 drop_mapstore2_adapter_mapstoreresource = "DROP TABLE IF EXISTS mapstore2_adapter_mapstoreresource CASCADE;"
 drop_mapstore2_adapter_mapstoreresource_attributes = "DROP TABLE IF EXISTS mapstore2_adapter_mapstoreresource_attributes CASCADE;"
 
+# stores the last migrated resource id so an interrupted migration restarts from there
+progress_table = "geonode_mapstore_client_migrate_map_blob_progress"
+create_progress_table = f"CREATE TABLE IF NOT EXISTS {progress_table} (last_id integer NOT NULL);"
+drop_progress_table = f"DROP TABLE IF EXISTS {progress_table} CASCADE;"
+
+
+def decode_attribute_value(value):
+    try:
+        '''
+        If is a byte we have to decode it
+        '''
+        return base64.b64decode(ast.literal_eval(value)).decode()
+    except Exception:
+        return value
+
+
+def get_map_blobs(cursor, resource_ids):
+    cursor.execute(
+        'SELECT resource_id, blob from mapstore2_adapter_mapstoredata where resource_id = ANY(%s);',
+        [list(resource_ids)]
+    )
+    blobs = {}
+    for resource_id, blob in cursor.fetchall():
+        blobs.setdefault(resource_id, blob)
+    return blobs
+
+
+def get_map_attributes(cursor, resource_ids):
+    cursor.execute(
+        'SELECT resource_id, name, value from mapstore2_adapter_mapstoreattribute where resource_id = ANY(%s);',
+        [list(resource_ids)]
+    )
+    attributes = defaultdict(dict)
+    for resource_id, name, value in cursor.fetchall():
+        attributes[resource_id][name] = decode_attribute_value(value)
+    return attributes
+
+
+def get_map_values(resource_id, blobs, attributes):
+    to_update = {}
+    if resource_id in blobs:
+        to_update['blob'] = blobs[resource_id]
+    resource_attributes = attributes.get(resource_id)
+    if resource_attributes:
+        to_update.update(resource_attributes)
+        thumb = to_update.pop('thumbnail', None)
+        if thumb and 'data:image/' not in thumb:
+            to_update['thumbnail_url'] = thumb
+    return to_update
+
+
+def _get_last_migrated_id(cursor):
+    cursor.execute(create_progress_table)
+    cursor.execute(f'SELECT last_id from {progress_table};')
+    result = cursor.fetchall()
+    return result[0][0] if result else 0
+
+
+def _set_last_migrated_id(cursor, last_id):
+    cursor.execute(f'DELETE from {progress_table};')
+    cursor.execute(f'INSERT INTO {progress_table} (last_id) VALUES (%s);', [last_id])
+
 
 def migrate_map_forward(apps, schema_editor):
 
     exists = False
-    sql_exists = "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'mapstore2_adapter_mapstoredata');"
+    sql_exists = "SELECT EXISTS (SELECT FROM information_schema.tables " \
+        "WHERE table_name = 'mapstore2_adapter_mapstoredata');"
     with connections['default'].cursor() as cursor:
         cursor.execute(sql_exists)
         result = cursor.fetchall()
         if result:
             exists = result[0][0]
     if exists:
+        batch_size = getattr(settings, 'MAPSTORE_MIGRATION_BATCH_SIZE', 1000)
         # We can't import the Map model directly as it may be a newer
         # version than this migration expects. We use the historical version.
         ResourceBase = apps.get_model('base', 'ResourceBase')
-        for _resource in ResourceBase.objects.filter(resource_type='map').iterator():
-            to_update = {}
-            # We can't use map.resourcebase_ptr, we need to explicitly retrieve the resourcebase
-            # mapstore2_adapter does not exist anymore as an app. So we need raw sql to get the blob from the old table.
-            sql_string = f'SELECT blob from mapstore2_adapter_mapstoredata where resource_id={_resource.id};'
-            '''
-            Getting the Data Blob
-            '''
-            with connections['default'].cursor() as cursor:
-                cursor.execute(sql_string)
-                result = cursor.fetchall()
-                if result:
-                    to_update['blob'] = result[0][0]
-
-            sql_string = f'SELECT name, value from mapstore2_adapter_mapstoreattribute where resource_id={_resource.id};'
-            '''
-            Getting the attributes
-            '''
-            with connections['default'].cursor() as cursor:
-                cursor.execute(sql_string)
-                result = cursor.fetchall()
-                if result:
-                    for x in result:
-                        try:
-                            '''
-                            If is a byte we have to decode it
-                            '''
-                            to_update[x[0]] = base64.b64decode(ast.literal_eval(x[1])).decode()
-                        except:
-                            to_update[x[0]] = x[1]
-
-                thumb = to_update.pop('thumbnail', None)
-                if thumb and 'data:image/' not in thumb:
-                    to_update['thumbnail_url'] = thumb
-            '''
-            Updating the resource
-            '''
-            if to_update:
-                ResourceBase.objects.filter(id=_resource.id).update(**to_update)
-
+        maps = ResourceBase.objects.filter(resource_type='map').order_by('id')
+        with connections['default'].cursor() as cursor:
+            last_id = _get_last_migrated_id(cursor)
+        total = maps.count()
+        migrated = maps.filter(id__lte=last_id).count()
+        while True:
+            resources = list(maps.filter(id__gt=last_id).only('id')[:batch_size])
+            if not resources:
+                break
+            resource_ids = [_resource.id for _resource in resources]
+            # every batch is committed together with its checkpoint
+            with transaction.atomic(using='default'), connections['default'].cursor() as cursor:
+                # mapstore2_adapter does not exist anymore as an app.
+                # So we need raw sql to get the blob from the old table.
+                blobs = get_map_blobs(cursor, resource_ids)
+                attributes = get_map_attributes(cursor, resource_ids)
+                # bulk_update writes the same fields for all the objects so resources are grouped by updated fields
+                to_update = defaultdict(list)
+                for _resource in resources:
+                    values = get_map_values(_resource.id, blobs, attributes)
+                    for name, value in values.items():
+                        setattr(_resource, name, value)
+                    if values:
+                        to_update[tuple(sorted(values))].append(_resource)
+                for fields, _resources in to_update.items():
+                    ResourceBase.objects.bulk_update(_resources, fields, batch_size=batch_size)
+                last_id = resource_ids[-1]
+                _set_last_migrated_id(cursor, last_id)
+            migrated += len(resource_ids)
+            logger.info(f'Migrated map blobs: {migrated}/{total}')
+        with connections['default'].cursor() as cursor:
+            cursor.execute(drop_progress_table)
 
 
 def migrate_map_reverse(apps, schema_editor):
@@ -71,15 +133,17 @@ def migrate_map_reverse(apps, schema_editor):
 
     Map = apps.get_model('maps', 'Map')
     ResourceBase = apps.get_model('base', 'ResourceBase')
-    for _map in Map.objects.iterator():
-        # We can't use map.resourcebase_ptr, we need to explicitly retrieve the resourcebase
-        resourcebase = ResourceBase.objects.get(id=_map.resourcebase_ptr_id)
-        resourcebase.blob = dict()
-        resourcebase.save()
+    # We can't use map.resourcebase_ptr, we need to explicitly retrieve the resourcebase
+    ResourceBase.objects.filter(
+        id__in=Map.objects.values('resourcebase_ptr_id')
+    ).update(blob=dict())
 
 
 class Migration(migrations.Migration):
 
+    # maps are migrated in batches committed one by one
+    atomic = False
+
     dependencies = [
         ('geonode_mapstore_client', '0001_clean_prev_version_geoapps'),
         ('maps', '0042_remove_maplayer_styles'),
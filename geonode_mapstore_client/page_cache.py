@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import re
+import uuid
+import hashlib
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag, urlencode
+from django.utils.translation import get_language
+
+from geonode_mapstore_client.templatetags.client_version import get_client_version
+
+logger = logging.getLogger(__name__)
+
+SHELL_VERSION_CACHE_KEY = 'geonode_mapstore_client.shell_version'
+SHELL_USER_VERSION_CACHE_KEY = 'geonode_mapstore_client.shell_version.user.{}'
+SHELL_RESOURCE_VERSION_CACHE_KEY = 'geonode_mapstore_client.shell_version.resource.{}'
+SHELL_CACHE_KEY = 'geonode_mapstore_client.shell.{}'
+# names of the GeoNode urls rendering the embed templates of the MapStoreHookSet
+CACHED_SHELL_URL_NAMES = ['map_embed', 'dataset_embed', 'geoapp_embed']
+# url keyword arguments identifying the resource of the cached pages,
+# the view permission on the resource is checked before serving a cached page
+SHELL_RESOURCE_URL_KWARGS = {
+    'map_embed': 'mapid',
+    'dataset_embed': 'layername',
+    'geoapp_embed': 'geoappid'
+}
+# query parameters changing the rendered pages, the other parameters are not part of the cache key
+SHELL_CACHE_QUERY_PARAMS = ['layer', 'subtype', 'view', 'appType']
+# query parameters rendered in the pages as credentials, the pages requested with them are not cached
+SHELL_UNCACHED_QUERY_PARAMS = ('apikey',)
+# the CSRF tokens rendered by the csrf_token tag are cached as a placeholder filled on each response
+CSRF_TOKEN_PLACEHOLDER = b'__mapstore_csrf_token__'
+CSRF_TOKEN_INPUT_REGEX = re.compile(rb'<input type="hidden" name="csrfmiddlewaretoken" value="([A-Za-z0-9]+)">')
+# headers set on each response and not stored with the cached pages
+SHELL_RESPONSE_HEADERS = ('content-length', 'etag', 'cache-control')
+
+
+def get_shell_cache_timeout():
+    # the pages are cached only when a timeout is configured
+    return getattr(settings, 'MAPSTORE_SHELL_CACHE_TIMEOUT', 0)
+
+
+def _get_versions(keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if versions.get(key) is None:
+            version = uuid.uuid4().hex
+            cache.add(key, version, None)
+            versions[key] = cache.get(key, version)
+    return [versions[key] for key in keys]
+
+
+def get_shell_version():
+    return _get_versions([SHELL_VERSION_CACHE_KEY])[0]
+
+
+def invalidate_shell_cache(*args, **kwargs):
+    """
+    Change the version included in the keys of all the cached pages
+    """
+    cache.set(SHELL_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_user_shell_cache(user_id):
+    cache.set(SHELL_USER_VERSION_CACHE_KEY.format(user_id), uuid.uuid4().hex, None)
+
+
+def invalidate_resource_shell_cache(resource_id):
+    cache.set(SHELL_RESOURCE_VERSION_CACHE_KEY.format(resource_id), uuid.uuid4().hex, None)
+
+
+def invalidate_shell_cache_on_resource_change(sender, instance, **kwargs):
+    """
+    Subclasses of ResourceBase send the model signals with their own class as sender
+    """
+    from geonode.base.models import ResourceBase
+
+    if isinstance(instance, ResourceBase):
+        invalidate_resource_shell_cache(instance.pk)
+
+
+def invalidate_shell_cache_on_object_permission_change(sender, instance, **kwargs):
+    # the resources share the pk of their ResourceBase
+    invalidate_resource_shell_cache(instance.object_pk)
+
+
+def invalidate_shell_cache_on_user_change(sender, instance, update_fields=None, **kwargs):
+    # the last login is updated on each login and it's not rendered in the pages
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_user_shell_cache(instance.pk)
+
+
+def invalidate_shell_cache_on_user_related_change(sender, instance, **kwargs):
+    """
+    Avatars and access tokens change only the pages of their user
+    """
+    if getattr(instance, 'user_id', None) is not None:
+        invalidate_user_shell_cache(instance.user_id)
+
+
+def invalidate_shell_cache_on_user_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_user_shell_cache(instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            invalidate_user_shell_cache(user_id)
+    else:
+        # the users removed from a cleared group are not known
+        invalidate_shell_cache()
+
+
+def _get_user_key(request):
+    user = request.user
+    if not user.is_authenticated:
+        return 'anonymous'
+    return f'user-{user.pk}'
+
+
+def _is_mobile(request):
+    user_agent = getattr(request, 'user_agent', None)
+    return bool(user_agent and user_agent.is_mobile)
+
+
+def _get_query_key(request):
+    names = getattr(settings, 'MAPSTORE_SHELL_CACHE_QUERY_PARAMS', SHELL_CACHE_QUERY_PARAMS)
+    return urlencode(sorted((name, value) for name in names for value in request.GET.getlist(name)))
+
+
+def get_shell_cache_key(request, resource_id=None):
+    user = request.user
+    version_keys = [SHELL_VERSION_CACHE_KEY]
+    if user.is_authenticated:
+        version_keys.append(SHELL_USER_VERSION_CACHE_KEY.format(user.pk))
+    if resource_id is not None:
+        version_keys.append(SHELL_RESOURCE_VERSION_CACHE_KEY.format(resource_id))
+    key = '|'.join(_get_versions(version_keys) + [
+        request.path,
+        _get_query_key(request),
+        _get_user_key(request),
+        get_language() or '',
+        'mobile' if _is_mobile(request) else 'desktop',
+        get_client_version()
+    ])
+    return SHELL_CACHE_KEY.format(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
+def _get_resource_id(resource_kwarg, value):
+    """
+    Id of the resource identified by the url keyword argument, None if it cannot be resolved
+    """
+    if not value:
+        return None
+    if resource_kwarg == 'layername':
+        from geonode_mapstore_client.hooksets import get_dataset_id_and_type
+
+        dataset = get_dataset_id_and_type(value)
+        return dataset[0] if dataset else None
+    # the views look up the other identifiers by url suffix
+    return int(value) if value.isdigit() else None
+
+
+def _can_view_resource(user, resource_id):
+    from geonode.base.models import ResourceBase
+
+    resource = ResourceBase.objects.non_polymorphic().filter(pk=resource_id).only('id').first()
+    return resource is not None and user.has_perm('base.view_resourcebase', resource)
+
+
+def _is_cacheable(request, response):
+    return response.status_code == 200 \
+        and not response.streaming \
+        and not response.cookies \
+        and not getattr(getattr(request, 'session', None), 'modified', False)
+
+
+def _strip_csrf_token(request, content):
+    """
+    Replace the CSRF tokens rendered by the csrf_token tag with a placeholder,
+    None when the token has been used without the tag
+    """
+    if not request.META.get('CSRF_COOKIE_USED'):
+        return content
+    tokens = set(CSRF_TOKEN_INPUT_REGEX.findall(content))
+    if not tokens:
+        return None
+    for token in tokens:
+        content = content.replace(token, CSRF_TOKEN_PLACEHOLDER)
+    return content
+
+
+def _get_etag(request, cached):
+    """
+    The ETag of the pages with a CSRF token changes with the CSRF cookie of the browser
+    """
+    etag = cached['etag']
+    if cached['csrf']:
+        etag = hashlib.md5((etag + request.META.get('CSRF_COOKIE', '')).encode('utf-8')).hexdigest()
+    return quote_etag(etag)
+
+
+def _cached_shell_response(request, cached):
+    content = cached['content']
+    if cached['csrf']:
+        content = content.replace(CSRF_TOKEN_PLACEHOLDER, get_token(request).encode('ascii'))
+    response = HttpResponse(content)
+    for header, value in cached['headers']:
+        response[header] = value
+    if cached['xframe_options_exempt']:
+        response.xframe_options_exempt = True
+    return response
+
+
+def _shell_response(request, response, etag):
+    response['ETag'] = etag
+    # the page depends on the user and on the device so it can be revalidated only by the browser
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ('Cookie', 'User-Agent', 'Accept-Language'))
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def cache_shell_page(view_func, resource_kwarg=None):
+    """
+    Cache the pages rendered by view_func by path, query parameters listed in MAPSTORE_SHELL_CACHE_QUERY_PARAMS,
+    user, language, mobile device and client version,
+    the cached pages are served with ETag and answer to If-None-Match with 304.
+    The pages of a resource, identified by the resource_kwarg url argument, are served from the cache
+    only to the users with the view permission on the resource
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        timeout = get_shell_cache_timeout()
+        if not timeout or request.method not in ('GET', 'HEAD') \
+                or any(param in request.GET for param in SHELL_UNCACHED_QUERY_PARAMS):
+            return view_func(request, *args, **kwargs)
+        resource_id = None
+        if resource_kwarg:
+            resource_id = _get_resource_id(resource_kwarg, kwargs.get(resource_kwarg))
+            if resource_id is None:
+                return view_func(request, *args, **kwargs)
+        key = get_shell_cache_key(request, resource_id)
+        cached = cache.get(key)
+        if cached and (resource_id is None or _can_view_resource(request.user, resource_id)):
+            # the CSRF cookie used by the ETag is set when the token is filled
+            response = _cached_shell_response(request, cached)
+            return _shell_response(request, response, _get_etag(request, cached))
+        response = view_func(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+        if not _is_cacheable(request, response):
+            return response
+        content = _strip_csrf_token(request, response.content)
+        if content is None:
+            return response
+        cached = {
+            'content': content,
+            'etag': hashlib.md5(content).hexdigest(),
+            'csrf': CSRF_TOKEN_PLACEHOLDER in content,
+            'headers': [
+                (header, value) for header, value in response.items()
+                if header.lower() not in SHELL_RESPONSE_HEADERS
+            ],
+            'xframe_options_exempt': getattr(response, 'xframe_options_exempt', False)
+        }
+        cache.set(key, cached, timeout)
+        return _shell_response(request, response, _get_etag(request, cached))
+    return wrapper
+
+
+def cache_shell_url_patterns(patterns, names=None):
+    """
+    Wrap with cache_shell_page the views of the url patterns with the given names,
+    included url patterns are visited recursively
+    """
+    if names is None:
+        names = getattr(settings, 'MAPSTORE_CACHED_SHELL_URL_NAMES', CACHED_SHELL_URL_NAMES)
+    for pattern in patterns:
+        url_patterns = getattr(pattern, 'url_patterns', None)
+        if url_patterns is not None:
+            cache_shell_url_patterns(url_patterns, names)
+        elif getattr(pattern, 'name', None) in names \
+                and not getattr(pattern.callback, 'cache_shell_page', False):
+            pattern.callback = cache_shell_page(pattern.callback, SHELL_RESOURCE_URL_KWARGS.get(pattern.name))
+            pattern.callback.cache_shell_page = True
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import time
+import hashlib
+import logging
+import posixpath
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http.request import validate_host
+
+logger = logging.getLogger(__name__)
+
+SERVICE_ORIGINS_CACHE_KEY = 'geonode_mapstore_client.proxy_service_origins'
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+CACHEABLE_REQUESTS = ('getcapabilities', 'describefeaturetype', 'getlegendgraphic')
+# Cache-Control directives of the upstream responses that must not be stored by the proxy
+UNCACHEABLE_RESPONSE_DIRECTIVES = ('private', 'no-store')
+FORWARDED_REQUEST_HEADERS = ('Accept', 'Accept-Language', 'Content-Type', 'If-None-Match', 'If-Modified-Since')
+FORWARDED_RESPONSE_HEADERS = (
+    'Content-Type', 'Content-Encoding', 'Content-Length', 'Content-Disposition',
+    'Cache-Control', 'Expires', 'ETag', 'Last-Modified', 'Location'
+)
+CHUNK_SIZE = 64 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+class LRUCache:
+    """
+    Thread safe least recently used cache with a maximum number of entries
+    and a time to live for each entry
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_proxy_session():
+    """
+    Session shared by the proxy requests of this process,
+    connections are kept alive in a pool for each upstream host
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = getattr(settings, 'MAPSTORE_PROXY_POOL_SIZE', 10)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def get_proxy_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = LRUCache(
+                    getattr(settings, 'MAPSTORE_PROXY_CACHE_SIZE', 256),
+                    getattr(settings, 'MAPSTORE_PROXY_CACHE_TIMEOUT', 60 * 5)
+                )
+    return _response_cache
+
+
+def get_origin(url):
+    """
+    Scheme, hostname and port of an http url, the default port of the scheme is used when missing
+    """
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    if parts.scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+    return parts.scheme, parts.hostname.lower(), port or DEFAULT_PORTS[parts.scheme]
+
+
+def _get_normalized_path(url):
+    # dot segments and encoded slashes cannot be used to leave a path prefix
+    path = posixpath.normpath(unquote(urlsplit(url).path) or '/')
+    return path if path.endswith('/') else path + '/'
+
+
+def get_geoserver_locations():
+    """
+    Origin and path prefix of the internal and of the public GeoServer location, the client requests the public one
+    """
+    ogc_server = getattr(settings, 'OGC_SERVER', {}).get('default', {})
+    locations = []
+    for name in ('LOCATION', 'PUBLIC_LOCATION'):
+        url = ogc_server.get(name) or ''
+        origin = get_origin(url)
+        if origin:
+            locations.append((origin, _get_normalized_path(url)))
+    return locations
+
+
+def is_geoserver_url(url):
+    """
+    Check if the url is an url of GeoServer, the access token of the user is sent only to these urls
+    """
+    origin = get_origin(url)
+    if origin is None:
+        return False
+    path = _get_normalized_path(url)
+    return any(
+        origin == location_origin and path.startswith(location_path)
+        for location_origin, location_path in get_geoserver_locations()
+    )
+
+
+def _get_service_origins():
+    from geonode.services.models import Service
+
+    origins = cache.get(SERVICE_ORIGINS_CACHE_KEY)
+    if origins is None:
+        origins = [get_origin(base_url) for base_url in Service.objects.values_list('base_url', flat=True)]
+        cache.set(SERVICE_ORIGINS_CACHE_KEY, origins, 60)
+    return origins
+
+
+def get_proxy_allowed_origins():
+    """
+    Origins of SITEURL and of the remote services, any path of these origins can be requested
+    """
+    origins = [get_origin(getattr(settings, 'SITEURL', ''))] + _get_service_origins()
+    return [origin for origin in origins if origin]
+
+
+def is_proxy_url_allowed(url):
+    """
+    Allowed urls are the GeoServer urls, the urls with the origin of SITEURL or of a remote service
+    and the urls of the PROXY_ALLOWED_HOSTS hosts on the default port of their scheme
+    """
+    origin = get_origin(url)
+    if origin is None:
+        return False
+    if is_geoserver_url(url) or origin in get_proxy_allowed_origins():
+        return True
+    scheme, hostname, port = origin
+    return port == DEFAULT_PORTS[scheme] \
+        and validate_host(hostname, list(getattr(settings, 'PROXY_ALLOWED_HOSTS', ())))
+
+
+def is_cacheable_request(method, url):
+    if method != 'GET':
+        return False
+    params = {key.lower(): value for key, value in parse_qsl(urlsplit(url).query)}
+    return params.get('request', '').lower() in CACHEABLE_REQUESTS
+
+
+def is_cacheable_response(upstream):
+    if upstream.status_code != 200:
+        return False
+    directives = {
+        directive.split('=', 1)[0].strip().lower()
+        for directive in upstream.headers.get('Cache-Control', '').split(',')
+    }
+    return not directives.intersection(UNCACHEABLE_RESPONSE_DIRECTIVES)
+
+
+def get_proxy_cache_key(url, accept_encoding, auth_key):
+    key = '|'.join([url, accept_encoding, auth_key or ''])
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def stream_upstream_response(upstream, cache_key=None):
+    """
+    Yield the raw body of the upstream response without decoding it,
+    the body is stored in the response cache when it's complete and smaller than the configured limit
+    """
+    max_size = getattr(settings, 'MAPSTORE_PROXY_CACHE_MAX_ENTRY_SIZE', 1024 * 1024)
+    chunks = [] if cache_key else None
+    size = 0
+    try:
+        for chunk in upstream.raw.stream(CHUNK_SIZE, decode_content=False):
+            if chunks is not None:
+                size += len(chunk)
+                if size > max_size:
+                    chunks = None
+                else:
+                    chunks.append(chunk)
+            yield chunk
+    finally:
+        upstream.close()
+    if chunks is not None:
+        get_proxy_response_cache().set(cache_key, {
+            'status': upstream.status_code,
+            'headers': get_forwarded_response_headers(upstream),
+            'content': b''.join(chunks)
+        })
+
+
+def get_forwarded_response_headers(upstream):
+    return [
+        (name, upstream.headers[name])
+        for name in FORWARDED_RESPONSE_HEADERS
+        if name in upstream.headers
+    ]
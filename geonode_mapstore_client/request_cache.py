@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+
+REQUEST_CACHE_ATTRIBUTE = '_mapstore_request_cache'
+
+
+def get_request_cache(request):
+    """
+    Return the dictionary of the values computed for the current request,
+    the dictionary lives as long as the request object
+    """
+    request_cache = getattr(request, REQUEST_CACHE_ATTRIBUTE, None)
+    if request_cache is None:
+        request_cache = {}
+        setattr(request, REQUEST_CACHE_ATTRIBUTE, request_cache)
+    return request_cache
+
+
+def request_cached(request, key, func):
+    """
+    Return the value of func computed once per request,
+    func is called on every invocation when no request is available
+    """
+    if request is None:
+        return func()
+    request_cache = get_request_cache(request)
+    if key not in request_cache:
+        request_cache[key] = func()
+    return request_cache[key]
+
+
+class RequestCacheMiddleware:
+    """
+    Start every request with an empty cache,
+    it makes the cache independent from request objects reused by the callers (eg. tests client)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        setattr(request, REQUEST_CACHE_ATTRIBUTE, {})
+        return self.get_response(request)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import time
+import queue
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction, close_old_connections
+
+from geonode.celery_app import app
+
+logger = logging.getLogger(__name__)
+
+STYLE_VISUAL_MODE_PENDING_KEY = 'geonode_mapstore_client.style_visual_mode_pending.{}'
+
+_metrics = {
+    'enqueued': 0,
+    'deduplicated': 0,
+    'dropped': 0,
+    'retried': 0,
+    'succeeded': 0,
+    'failed': 0,
+    'latency_total': 0.0,
+    'latency_max': 0.0
+}
+_metrics_lock = threading.Lock()
+_style_visual_mode_queue = None
+_style_visual_mode_queue_lock = threading.Lock()
+
+
+def _get_max_retries():
+    return getattr(settings, 'MAPSTORE_STYLE_VISUAL_MODE_MAX_RETRIES', 3)
+
+
+def _get_retry_countdown(retries):
+    backoff = getattr(settings, 'MAPSTORE_STYLE_VISUAL_MODE_RETRY_BACKOFF', 5)
+    return min(backoff * 2 ** retries, 300)
+
+
+def _increase_metric(name, value=1):
+    with _metrics_lock:
+        _metrics[name] += value
+
+
+def get_style_visual_mode_metrics():
+    """
+    Counters of the style updates handled by this process,
+    latency is measured from the signal to the end of the update
+    """
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    completed = metrics['succeeded'] + metrics['failed']
+    metrics['latency_avg'] = metrics['latency_total'] / completed if completed else 0.0
+    metrics['queue_depth'] = _style_visual_mode_queue.qsize() if _style_visual_mode_queue else 0
+    return metrics
+
+
+def _complete_style_visual_mode_update(dataset_id, enqueued_at, status):
+    cache.delete(STYLE_VISUAL_MODE_PENDING_KEY.format(dataset_id))
+    latency = time.time() - enqueued_at
+    with _metrics_lock:
+        _metrics[status] += 1
+        _metrics['latency_total'] += latency
+        _metrics['latency_max'] = max(_metrics['latency_max'], latency)
+    logger.debug(f'Style visual mode update of dataset {dataset_id} {status} in {latency:.2f}s')
+
+
+def update_style_visual_mode(dataset_id, catalog=None):
+    from geonode.layers.models import Dataset
+    from geonode_mapstore_client.utils import set_dataset_style_to_open_in_visual_mode
+
+    dataset = Dataset.objects.filter(id=dataset_id).first()
+    if dataset:
+        if catalog:
+            set_dataset_style_to_open_in_visual_mode(dataset, catalog=catalog)
+        else:
+            set_dataset_style_to_open_in_visual_mode(dataset)
+
+
+@app.task(
+    bind=True,
+    name='geonode_mapstore_client.tasks.set_style_visual_mode',
+    queue='geonode',
+    acks_late=False,
+    ignore_result=True)
+def set_style_visual_mode(self, dataset_id, enqueued_at):
+    try:
+        update_style_visual_mode(dataset_id)
+    except Exception as e:
+        if self.request.retries < _get_max_retries():
+            _increase_metric('retried')
+            raise self.retry(exc=e, countdown=_get_retry_countdown(self.request.retries))
+        _complete_style_visual_mode_update(dataset_id, enqueued_at, 'failed')
+        logger.error(f'Failed to set the visual mode on the style of dataset {dataset_id}: {e}')
+        return
+    _complete_style_visual_mode_update(dataset_id, enqueued_at, 'succeeded')
+
+
+class StyleVisualModeQueue:
+    """
+    Bounded queue of style updates processed by a pool of threads,
+    used when the signals are not dispatched with celery
+    """
+
+    def __init__(self, workers, size):
+        self._queue = queue.Queue(maxsize=size)
+        self._threads = [
+            threading.Thread(target=self._work, name=f'mapstore-style-visual-mode-{index}', daemon=True)
+            for index in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def put(self, dataset_id, enqueued_at):
+        self._queue.put_nowait((dataset_id, enqueued_at))
+
+    def _process(self, dataset_id, enqueued_at):
+        retries = 0
+        while True:
+            try:
+                update_style_visual_mode(dataset_id)
+            except Exception as e:
+                if retries < _get_max_retries():
+                    _increase_metric('retried')
+                    time.sleep(_get_retry_countdown(retries))
+                    retries += 1
+                    continue
+                _complete_style_visual_mode_update(dataset_id, enqueued_at, 'failed')
+                logger.error(f'Failed to set the visual mode on the style of dataset {dataset_id}: {e}')
+                return
+            _complete_style_visual_mode_update(dataset_id, enqueued_at, 'succeeded')
+            return
+
+    def _work(self):
+        while True:
+            dataset_id, enqueued_at = self._queue.get()
+            try:
+                self._process(dataset_id, enqueued_at)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+
+def get_style_visual_mode_queue():
+    global _style_visual_mode_queue
+    if _style_visual_mode_queue is None:
+        with _style_visual_mode_queue_lock:
+            if _style_visual_mode_queue is None:
+                _style_visual_mode_queue = StyleVisualModeQueue(
+                    getattr(settings, 'MAPSTORE_STYLE_VISUAL_MODE_WORKERS', 2),
+                    getattr(settings, 'MAPSTORE_STYLE_VISUAL_MODE_QUEUE_SIZE', 1000)
+                )
+    return _style_visual_mode_queue
+
+
+def _use_celery():
+    return getattr(settings, 'ASYNC_SIGNALS', False) and \
+        not getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False)
+
+
+def _dispatch_style_visual_mode_update(dataset_id):
+    enqueued_at = time.time()
+    if _use_celery():
+        set_style_visual_mode.apply_async(args=(dataset_id, enqueued_at))
+        return
+    try:
+        get_style_visual_mode_queue().put(dataset_id, enqueued_at)
+    except queue.Full:
+        cache.delete(STYLE_VISUAL_MODE_PENDING_KEY.format(dataset_id))
+        _increase_metric('dropped')
+        logger.warning(f'Style visual mode queue is full, dataset {dataset_id} skipped')
+
+
+def enqueue_style_visual_mode_update(dataset_id):
+    """
+    Schedule the style update of a dataset after the current transaction is committed,
+    repeated requests for a dataset already in the queue are ignored
+    """
+    pending_timeout = getattr(settings, 'MAPSTORE_STYLE_VISUAL_MODE_PENDING_TIMEOUT', 60 * 10)
+    if not cache.add(STYLE_VISUAL_MODE_PENDING_KEY.format(dataset_id), True, pending_timeout):
+        _increase_metric('deduplicated')
+        return
+    _increase_metric('enqueued')
+    transaction.on_commit(lambda: _dispatch_style_visual_mode_update(dataset_id))
+
+
+@app.task(
+    bind=True,
+    name='geonode_mapstore_client.tasks.refresh_catalogue_service_index',
+    queue='geonode',
+    acks_late=False,
+    ignore_result=True)
+def refresh_catalogue_service_index(self, service_id):
+    from geonode_mapstore_client.catalogue_services import CATALOGUE_INDEX_PENDING_KEY, refresh_catalogue_index
+
+    try:
+        refresh_catalogue_index(service_id)
+    except Exception as e:
+        logger.error(f'Failed to index the catalogue service {service_id}: {e}')
+    finally:
+        cache.delete(CATALOGUE_INDEX_PENDING_KEY.format(service_id))
+
+
+@app.task(
+    bind=True,
+    name='geonode_mapstore_client.tasks.refresh_catalogue_services_index',
+    queue='geonode',
+    acks_late=False,
+    ignore_result=True)
+def refresh_catalogue_services_index(self):
+    from geonode_mapstore_client.catalogue_services import get_indexed_catalogue_services
+
+    for service_id in get_indexed_catalogue_services():
+        enqueue_catalogue_service_index_refresh(service_id)
+
+
+def enqueue_catalogue_service_index_refresh(service_id):
+    """
+    Schedule the refresh of the index of a catalogue service unless one is already pending
+    """
+    from geonode_mapstore_client.catalogue_services import CATALOGUE_INDEX_PENDING_KEY
+
+    if cache.add(CATALOGUE_INDEX_PENDING_KEY.format(service_id), True, 60 * 10):
+        refresh_catalogue_service_index.apply_async(args=(service_id,))
@@ -13,16 +13,27 @@ import logging
 from urllib.parse import urlparse
 
 from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
 from geonode.base.auth import extract_user_from_headers, get_auth_token
 
 from django import template
 
+from geonode_mapstore_client.instrumentation import instrument
+from geonode_mapstore_client.request_cache import request_cached
+
 logger = logging.getLogger(__name__)
 register = template.Library()
 
+APIKEY_CACHE_KEY = 'geonode_mapstore_client.apikey.{}'
+
 
 @register.simple_tag()
+@instrument('generate_proxyurl')
 def generate_proxyurl(_url, request):
+    if getattr(settings, 'MAPSTORE_PROXY_ENABLED', False):
+        _url = f"{reverse('mapstore_proxy')}?url="
     if request:
         apikey = request.GET.get('apikey')
         if apikey:
@@ -32,7 +43,45 @@ def generate_proxyurl(_url, request):
     return _url
 
 
+def _get_apikey_cache_timeout():
+    return getattr(settings, 'MAPSTORE_APIKEY_CACHE_TIMEOUT', 60 * 5)
+
+
+def get_cached_auth_token(user):
+    """
+    Return the key of the auth token of the user, the token is kept in the Django cache
+    until it expires or it is created, updated or revoked
+    """
+    if not user or not user.is_authenticated:
+        return None
+    timeout = _get_apikey_cache_timeout()
+    if not timeout:
+        return str(get_auth_token(user) or '') or None
+    key = APIKEY_CACHE_KEY.format(user.pk)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached or None
+    token = get_auth_token(user)
+    expires = getattr(token, 'expires', None)
+    if expires:
+        timeout = min(timeout, int((expires - timezone.now()).total_seconds()))
+    value = str(token or '')
+    if timeout > 0:
+        # an empty string marks the users without token
+        cache.set(key, value, timeout)
+    return value or None
+
+
+def invalidate_apikey_cache(sender, instance, **kwargs):
+    cache.delete(APIKEY_CACHE_KEY.format(instance.user_id))
+
+
 @register.simple_tag()
+@instrument('retrieve_apikey')
 def retrieve_apikey(request):
     if settings.ENABLE_APIKEY_LOGIN:
-        return get_auth_token(request.user) or None
+        return request_cached(
+            request,
+            f'apikey.{request.user.pk}',
+            lambda: get_cached_auth_token(request.user)
+        )
@@ -1,28 +1,100 @@
 import os
+import json
 import logging
+import threading
 
 from django import template
 from django.conf import settings
 from django.contrib.staticfiles.finders import find
+from django.templatetags.static import static
+
+from geonode_mapstore_client.instrumentation import instrument
 
 logger = logging.getLogger(__name__)
 register = template.Library()
 
+VERSION_PATH = 'mapstore/version.txt'
+MANIFEST_PATH = 'mapstore/dist/manifest.json'
 
-@register.simple_tag
-def client_version():
-    version_path = 'mapstore/version.txt'
+# static file path -> resolved file path, mtime and parsed content
+_cache = {}
+_lock = threading.Lock()
+
+
+def _resolve_static_file_path(path):
     if settings.DEBUG:
-        file_path = find(version_path)
-    else:
-        file_path = os.path.join(
-            settings.STATIC_ROOT,
-            version_path
-        )
+        return find(path)
+    return os.path.join(
+        settings.STATIC_ROOT,
+        path
+    )
+
+
+def get_static_file_content(path, parse=None, default='', log_errors=True):
+    """
+    Return the content of a static file, reading it only
+    when its modification time changes.
+    The resolved path is kept in memory so the staticfiles finders
+    are walked only once per process.
+    """
+    entry = _cache.get(path) or {}
+    file_path = entry.get('file_path') or _resolve_static_file_path(path)
     try:
-        with open(file_path, 'r') as f:
-            version = f.read()
-        return version
+        mtime = os.stat(file_path).st_mtime
     except Exception as e:
-        logger.error(e)
-        return ''
+        if log_errors:
+            logger.error(e)
+        # the static files could have been moved, resolve the path again on next call
+        _cache.pop(path, None)
+        return default
+    if file_path == entry.get('file_path') and mtime == entry.get('mtime'):
+        return entry['value']
+    with _lock:
+        try:
+            with open(file_path, 'r') as f:
+                value = parse(f) if parse else f.read()
+        except Exception as e:
+            logger.error(e)
+            return default
+        _cache[path] = {
+            'file_path': file_path,
+            'mtime': mtime,
+            'value': value
+        }
+    return value
+
+
+def get_client_version():
+    return get_static_file_content(VERSION_PATH)
+
+
+def get_client_manifest():
+    """
+    Manifest of the content hashed assets written by the build_client_manifest command
+    """
+    return get_static_file_content(MANIFEST_PATH, parse=json.load, default={}, log_errors=False)
+
+
+def warm_client_version_cache():
+    _cache.clear()
+    get_client_manifest()
+    return get_client_version()
+
+
+@register.simple_tag
+@instrument('client_version')
+def client_version():
+    return get_client_version()
+
+
+@register.simple_tag
+@instrument('client_asset')
+def client_asset(path):
+    """
+    Url of the content hashed copy of a static asset,
+    the asset url with the client version as query string if it's not listed in the manifest
+    """
+    hashed_path = get_client_manifest().get('files', {}).get(path)
+    if hashed_path:
+        return static(hashed_path)
+    return f'{static(path)}?{get_client_version()}'
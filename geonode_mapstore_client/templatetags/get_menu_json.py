@@ -1,10 +1,32 @@
+import uuid
+import hashlib
+import threading
+from types import MappingProxyType
+
 from avatar.templatetags.avatar_tags import avatar_url
 from django import template
 from django.conf import settings
-from geonode.base.models import Configuration, Menu, MenuItem
+from django.core.cache import cache
+from django.utils.functional import LazyObject, SimpleLazyObject, empty
+from django.utils.translation import get_language
+from geonode.base.models import Configuration, MenuItem
+
+from geonode_mapstore_client.instrumentation import instrument
+from geonode_mapstore_client.request_cache import request_cached
 
 register = template.Library()
 
+MENU_CACHE_KEY = 'geonode_mapstore_client.menus_json'
+READ_ONLY_CACHE_KEY = 'geonode_mapstore_client.read_only'
+AVATAR_URL_CACHE_KEY = 'geonode_mapstore_client.avatar_url.{}'
+MENU_VERSION_CACHE_KEY = 'geonode_mapstore_client.menu_version'
+MENU_USER_VERSION_CACHE_KEY = 'geonode_mapstore_client.menu_version.user.{}'
+MENU_FRAGMENT_CACHE_KEY = 'geonode_mapstore_client.menu_fragment.{}'
+
+# read-only menu structures built once for each variant and shared by all the renders
+_menu_templates = {}
+_menu_templates_lock = threading.Lock()
+
 
 def _handle_single_item(menu_item):
     m_item = {}
@@ -18,14 +40,78 @@ def _handle_single_item(menu_item):
 def _is_mobile_device(context):
     if context and 'request' in context:
         req = context['request']
-        return req.user_agent.is_mobile
+        return request_cached(req, 'is_mobile_device', lambda: req.user_agent.is_mobile)
     return False
 
-@register.simple_tag(takes_context=True)
-def get_base_left_topbar_menu(context):
 
-    is_mobile = _is_mobile_device(context)
+def _get_user_class(user):
+    if not user.is_authenticated:
+        return 'anonymous'
+    if user.is_superuser:
+        return 'superuser'
+    return 'authenticated'
+
+
+def _get_menu_cache_timeout():
+    return getattr(settings, 'MAPSTORE_MENU_CACHE_TIMEOUT', 60 * 60)
+
+
+def _is_read_only():
+    read_only = cache.get(READ_ONLY_CACHE_KEY)
+    if read_only is None:
+        read_only = Configuration.load().read_only
+        cache.set(READ_ONLY_CACHE_KEY, read_only, _get_menu_cache_timeout())
+    return read_only
+
+
+def invalidate_read_only_cache(*args, **kwargs):
+    cache.delete(READ_ONLY_CACHE_KEY)
+    invalidate_menu_fragments()
 
+
+def _get_avatar_url(user):
+    key = AVATAR_URL_CACHE_KEY.format(user.pk)
+    url = cache.get(key)
+    if url is None:
+        url = avatar_url(user)
+        cache.set(key, url, _get_menu_cache_timeout())
+    return url
+
+
+def invalidate_avatar_url_cache(sender, instance, **kwargs):
+    cache.delete(AVATAR_URL_CACHE_KEY.format(instance.user_id))
+    invalidate_user_menu_fragments(instance.user_id)
+
+
+def _freeze_menu(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze_menu(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze_menu(item) for item in value)
+    return value
+
+
+def _lazy_menu(context, get_menu):
+    """
+    Menu computed when it is rendered, the menus of the fragments served from the cache are not computed
+    """
+    return SimpleLazyObject(lambda: get_menu(context))
+
+
+def _get_menu_template(key, build):
+    """
+    Menu structure of a variant, it is shared by all the renders so it is returned read-only
+    """
+    menu = _menu_templates.get(key)
+    if menu is None:
+        with _menu_templates_lock:
+            menu = _menu_templates.get(key)
+            if menu is None:
+                menu = _menu_templates[key] = _freeze_menu(build())
+    return menu
+
+
+def _build_base_left_topbar_menu(is_mobile):
     return [
         {
             "label": "Data",
@@ -72,19 +158,27 @@ def get_base_left_topbar_menu(context):
 
 
 @register.simple_tag(takes_context=True)
-def get_base_right_topbar_menu(context):
+def get_base_left_topbar_menu(context):
+    return _lazy_menu(context, _get_base_left_topbar_menu)
+
+
+@instrument('get_base_left_topbar_menu')
+def _get_base_left_topbar_menu(context):
 
     is_mobile = _is_mobile_device(context)
 
-    if is_mobile:
-        return []
+    return _get_menu_template(
+        ('base_left_topbar', is_mobile),
+        lambda: _build_base_left_topbar_menu(is_mobile)
+    )
+
 
+def _build_base_right_topbar_menu(user_class, read_only):
     home = {
         "type": "link",
         "href": "/",
         "label": "Home"
     }
-    user = context.get('request').user
     about = {
             "label": "About",
             "type": "dropdown",
@@ -101,7 +195,8 @@ def get_base_right_topbar_menu(context):
                 }
             ]
         }
-    if user.is_authenticated and not Configuration.load().read_only:
+    if user_class != 'anonymous' and not read_only:
+        is_superuser = user_class == 'superuser'
         about['items'].extend([
             {
                 "type": "divider"
@@ -115,44 +210,64 @@ def get_base_right_topbar_menu(context):
                 "type": "link",
                 "href": "/admin/people/profile/add/",
                 "label": "Add user"
-            } if user.is_superuser else None,
+            } if is_superuser else None,
             {
                 "type": "link",
                 "href": "/groups/create/",
                 "label": "Create group"
-            }if user.is_superuser else None,
+            }if is_superuser else None,
         ])
     return [home, about]
 
 
 @register.simple_tag(takes_context=True)
-def get_user_menu(context):
+def get_base_right_topbar_menu(context):
+    return _lazy_menu(context, _get_base_right_topbar_menu)
+
+
+@instrument('get_base_right_topbar_menu')
+def _get_base_right_topbar_menu(context):
 
     is_mobile = _is_mobile_device(context)
-    user = context.get('request').user
 
-    if not user.is_authenticated:
-        return [
-            {
-                "label": "Register",
-                "type": "link",
-                "href": "/account/signup/?next=/"
-            } if settings.ACCOUNT_OPEN_SIGNUP and not Configuration.load().read_only else None,
-            {
-                "label": "Sign in",
-                "type": "link",
-                "href": "/account/login/?next=/"
-            },
-        ]
+    if is_mobile:
+        return []
+
+    user_class = _get_user_class(context.get('request').user)
+    read_only = _is_read_only() if user_class != 'anonymous' else False
+    return _get_menu_template(
+        ('base_right_topbar', user_class, read_only),
+        lambda: _build_base_right_topbar_menu(user_class, read_only)
+    )
+
+
+def _build_anonymous_user_menu(open_signup):
+    return [
+        {
+            "label": "Register",
+            "type": "link",
+            "href": "/account/signup/?next=/"
+        } if open_signup else None,
+        {
+            "label": "Sign in",
+            "type": "link",
+            "href": "/account/login/?next=/"
+        },
+    ]
+
 
+def _build_user_menu(is_mobile, is_superuser, monitoring_enabled):
+    """
+    Menu of an authenticated user, the first item of the dropdown
+    is a placeholder for the user profile link
+    """
     devider = {
         "type": "divider"
     }
 
     profile_link = {
         "type": "link",
-        # get href of user profile
-        "href": user.get_absolute_url(),
+        "href": None,
         "label": "Profile"
     }
 
@@ -163,23 +278,17 @@ def get_user_menu(context):
     }
 
     if is_mobile:
-        return [
-            {
-                # get src of user avatar
-                "image": avatar_url(user),
-                "type": "dropdown",
-                "className": "gn-user-menu-dropdown",
-                "items": [
-                    profile_link,
-                    devider,
-                    logout
-                ]
-            }
-        ]
+        return {
+            "type": "dropdown",
+            "className": "gn-user-menu-dropdown",
+            "items": [
+                profile_link,
+                devider,
+                logout
+            ]
+        }
 
     profile = {
-        # get src of user avatar
-        "image": avatar_url(user),
         "type": "dropdown",
         "className": "gn-user-menu-dropdown",
         "items": [
@@ -212,7 +321,7 @@ def get_user_menu(context):
         logout
     ]
     monitoring = []
-    if settings.MONITORING_ENABLED:
+    if monitoring_enabled:
         monitoring = [
             devider,
             {
@@ -234,33 +343,211 @@ def get_user_menu(context):
         }
     ] + monitoring + [devider] + general
 
-    if user.is_superuser:
+    if is_superuser:
         profile['items'].extend(admin_only)
     else:
         profile['items'].extend(general)
 
-    return [profile]
+    return profile
+
+
+@register.simple_tag(takes_context=True)
+def get_user_menu(context):
+    return _lazy_menu(context, _get_user_menu)
+
+
+@instrument('get_user_menu')
+def _get_user_menu(context):
+
+    is_mobile = _is_mobile_device(context)
+    user = context.get('request').user
+
+    if not user.is_authenticated:
+        open_signup = settings.ACCOUNT_OPEN_SIGNUP and not _is_read_only()
+        return _get_menu_template(
+            ('anonymous_user', open_signup),
+            lambda: _build_anonymous_user_menu(open_signup)
+        )
+
+    is_superuser = user.is_superuser
+    monitoring_enabled = settings.MONITORING_ENABLED
+    profile = _get_menu_template(
+        ('user', is_mobile, is_superuser, monitoring_enabled),
+        lambda: _build_user_menu(is_mobile, is_superuser, monitoring_enabled)
+    )
+    # only the dropdown entries depending on the user are copied
+    profile_link = {
+        **profile['items'][0],
+        # get href of user profile
+        "href": user.get_absolute_url()
+    }
+    return [
+        {
+            **profile,
+            # get src of user avatar
+            "image": _get_avatar_url(user),
+            "items": (profile_link,) + profile['items'][1:]
+        }
+    ]
+
+
+def _build_menus_json():
+    """
+    Build the json of the menus of every placeholder with a single query,
+    menus without items are skipped
+    """
+    menu_items = MenuItem.objects \
+        .select_related('menu__placeholder') \
+        .order_by('menu__placeholder__name', 'menu__order', 'menu__id', 'order')
+    grouped_items = {}
+    for menu_item in menu_items:
+        menu = menu_item.menu
+        placeholder_menus = grouped_items.setdefault(menu.placeholder.name, {})
+        placeholder_menus.setdefault(menu.id, (menu, []))[1].append(menu_item)
+
+    menus_json = {}
+    for placeholder_name, placeholder_menus in grouped_items.items():
+        ms = []
+        for menu, items in placeholder_menus.values():
+            if len(items) > 1:
+                ms.append({
+                    'label': menu.title,
+                    'type': 'dropdown',
+                    'items': [_handle_single_item(menu_item) for menu_item in items]
+                })
+            else:
+                ms.append(_handle_single_item(items[0]))
+        menus_json[placeholder_name] = ms
+    return menus_json
+
+
+def get_menus_json():
+    menus_json = cache.get(MENU_CACHE_KEY)
+    if menus_json is None:
+        menus_json = _build_menus_json()
+        cache.set(MENU_CACHE_KEY, menus_json, _get_menu_cache_timeout())
+    return menus_json
+
+
+def invalidate_menu_cache(*args, **kwargs):
+    cache.delete(MENU_CACHE_KEY)
+    invalidate_menu_fragments()
 
 
 @register.simple_tag
+@instrument('get_menu_json')
 def get_menu_json(placeholder_name):
-    menus = {
-        m: MenuItem.objects.filter(menu=m).order_by('order')
-        for m in Menu.objects.filter(placeholder__name=placeholder_name)
-    }
-    ms = []
-    for menu, menu_items in menus.items():
-        if len(menu_items) > 1:
-            m = {}
-            m['label'] = menu.title
-            m['type'] = 'dropdown'
-            m['items'] = []
-            for menu_item in menu_items:
-                m_item = _handle_single_item(menu_item)
-                m['items'].append(m_item)
-
-            ms.append(m)
-        if len(menu_items) == 1:
-            m = _handle_single_item(menu_items.first())
-            ms.append(m)
-    return ms
+    return get_menus_json().get(placeholder_name, [])
+
+
+def _get_versions(keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if versions.get(key) is None:
+            version = uuid.uuid4().hex
+            cache.add(key, version, None)
+            versions[key] = cache.get(key, version)
+    return [versions[key] for key in keys]
+
+
+def get_menu_version():
+    return _get_versions([MENU_VERSION_CACHE_KEY])[0]
+
+
+def invalidate_menu_fragments(*args, **kwargs):
+    """
+    Change the version included in the keys of all the cached menu fragments
+    """
+    cache.set(MENU_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_user_menu_fragments(user_id):
+    """
+    Change the version included in the keys of the cached menu fragments of a user
+    """
+    cache.set(MENU_USER_VERSION_CACHE_KEY.format(user_id), uuid.uuid4().hex, None)
+
+
+def get_menu_fragment_cache_key(context, name, vary_on, user=None):
+    request = context.get('request')
+    user_class = _get_user_class(request.user) if request else 'anonymous'
+    version_keys = [MENU_VERSION_CACHE_KEY]
+    if user is not None and user.is_authenticated:
+        version_keys.append(MENU_USER_VERSION_CACHE_KEY.format(user.pk))
+        vary_on = [f'user-{user.pk}'] + list(vary_on)
+    key = '|'.join(_get_versions(version_keys) + [
+        name,
+        user_class,
+        'mobile' if _is_mobile_device(context) else 'desktop',
+        get_language() or ''
+    ] + [str(value) for value in vary_on])
+    return MENU_FRAGMENT_CACHE_KEY.format(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
+def _get_evaluated_csrf_token(context):
+    """
+    CSRF token of the context if it has been already used, evaluating it would set the CSRF cookie
+    """
+    csrf_token = context.get('csrf_token')
+    if isinstance(csrf_token, LazyObject):
+        csrf_token = None if csrf_token._wrapped is empty else csrf_token._wrapped
+    return str(csrf_token) if csrf_token else None
+
+
+class MenuFragmentCacheNode(template.Node):
+
+    def __init__(self, nodelist, name, vary_on, user=None):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+        self.user = user
+
+    def render(self, context):
+        timeout = _get_menu_cache_timeout()
+        if not timeout:
+            return self.nodelist.render(context)
+        key = get_menu_fragment_cache_key(
+            context,
+            self.name.resolve(context),
+            [value.resolve(context) for value in self.vary_on],
+            self.user.resolve(context) if self.user else None
+        )
+        value = cache.get(key)
+        if value is None:
+            value = self.nodelist.render(context)
+            csrf_token = _get_evaluated_csrf_token(context)
+            # fragments containing the csrf token are specific to a session
+            if not csrf_token or csrf_token == 'NOTPROVIDED' or csrf_token not in value:
+                cache.set(key, value, timeout)
+        return value
+
+
+@register.tag('menu_fragment_cache')
+def do_menu_fragment_cache(parser, token):
+    """
+    Cache the enclosed fragment by menu version, user role, mobile device and language,
+    additional arguments are included in the cache key. The fragments of a user, passed
+    with the user argument, are cleared separately from the ones of the other users:
+
+    {% menu_fragment_cache 'user_menu' request.user.username user=request.user %}
+        ...
+    {% endmenu_fragment_cache %}
+    """
+    nodelist = parser.parse(('endmenu_fragment_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires at least one argument.")
+    user = None
+    vary_on = []
+    for bit in bits[2:]:
+        if bit.startswith('user='):
+            user = parser.compile_filter(bit[len('user='):])
+        else:
+            vary_on.append(parser.compile_filter(bit))
+    return MenuFragmentCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        vary_on,
+        user
+    )
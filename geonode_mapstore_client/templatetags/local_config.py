@@ -0,0 +1,29 @@
+import json
+
+from django import template
+from django.utils.html import json_script
+
+from geonode_mapstore_client.local_config import get_patched_local_config
+
+register = template.Library()
+
+_json_script_cache = {
+    'etag': None,
+    'json_script': ''
+}
+
+
+@register.simple_tag
+def local_config_json_script():
+    """
+    Inline the patched localConfig as json_script with id LOCAL_CONFIG
+    """
+    content, etag = get_patched_local_config()
+    if content is None:
+        return ''
+    if etag != _json_script_cache['etag']:
+        _json_script_cache.update({
+            'etag': etag,
+            'json_script': json_script(json.loads(content), 'LOCAL_CONFIG')
+        })
+    return _json_script_cache['json_script']
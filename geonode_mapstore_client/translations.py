@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import re
+import copy
+import gzip
+import json
+import hashlib
+import threading
+
+from django.conf import settings
+
+from geonode_mapstore_client.templatetags.client_version import get_static_file_content
+
+DEFAULT_TRANSLATIONS_PATH = ['/static/mapstore/ms-translations', '/static/mapstore/gn-translations']
+LOCALE_REGEX = re.compile(r'^[A-Za-z]{2,3}(-[A-Za-z0-9]{2,8})*$')
+
+# locale -> parsed source files, merged content, gzipped content and etag
+_cache = {}
+_lock = threading.Lock()
+
+
+def get_translations_path():
+    return getattr(settings, "MAPSTORE_TRANSLATIONS_PATH", DEFAULT_TRANSLATIONS_PATH)
+
+
+def get_translations_static_folders(translations_path=None):
+    """
+    Convert the urls of the translations folders to static files paths,
+    None if one of the folders is not served as static file
+    """
+    static_url = settings.STATIC_URL
+    folders = []
+    for url in translations_path or get_translations_path():
+        if not url.startswith(static_url):
+            return None
+        folders.append(url[len(static_url):].strip('/'))
+    return folders
+
+
+def merge_translations(target, source):
+    """
+    Deep merge of the source messages in the target ones, the source values take precedence
+    """
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_translations(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+def get_merged_translations(locale):
+    """
+    Return the translations of all the folders merged, their gzipped version and a strong ETag,
+    the result is kept in memory until one of the translation files changes.
+    None if the locale is not valid or there are no translations for it
+    """
+    if not LOCALE_REGEX.match(locale):
+        return None
+    folders = get_translations_static_folders()
+    if not folders:
+        return None
+    sources = tuple(
+        get_static_file_content(f'{folder}/data.{locale}.json', parse=json.load, default=None, log_errors=False)
+        for folder in folders
+    )
+    if not any(sources):
+        return None
+    entry = _cache.get(locale)
+    if entry and len(entry['sources']) == len(sources) \
+            and all(cached is source for cached, source in zip(entry['sources'], sources)):
+        return entry
+    merged = {}
+    for source in sources:
+        if source:
+            merge_translations(merged, copy.deepcopy(source))
+    content = json.dumps(merged, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    entry = {
+        'sources': sources,
+        'content': content,
+        'gzip': gzip.compress(content, compresslevel=9),
+        'etag': hashlib.sha256(content).hexdigest()
+    }
+    with _lock:
+        _cache[locale] = entry
+    return entry
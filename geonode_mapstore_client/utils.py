@@ -5,25 +5,66 @@ from geoserver.catalog import FailedRequestError
 from geonode.geoserver.helpers import gs_catalog
 from geonode.layers.models import Dataset
 
+MS_FORCE_VISUAL_STYLE_METADATA = {
+    "style": {
+        "metadata": {
+            "msForceVisual": "true"
+        }
+    }
+}
+
+
+def get_style_json_url(rest_url, name, workspace=None):
+    if workspace:
+        return f"{rest_url.rstrip('/')}/workspaces/{workspace}/styles/{name}.json"
+    return f"{rest_url.rstrip('/')}/styles/{name}.json"
+
+
+def is_style_in_visual_mode(style_json):
+    """
+    Check the msForceVisual flag inside the metadata of a style json returned by the GeoServer rest api
+    """
+    metadata = ((style_json or {}).get('style') or {}).get('metadata') or {}
+    entries = metadata.get('entry') if isinstance(metadata, dict) else None
+    if entries is not None:
+        entries = entries if isinstance(entries, list) else [entries]
+        metadata = {entry.get('@key'): entry.get('$') for entry in entries if isinstance(entry, dict)}
+    return str(metadata.get('msForceVisual')).lower() == 'true'
+
+
+def get_dataset_style(dataset, catalog=gs_catalog):
+    return catalog.get_style(dataset.name, workspace=dataset.workspace) or \
+        catalog.get_style(dataset.name)
+
+
+def set_style_to_open_in_visual_mode(style, catalog=gs_catalog):
+    headers = {
+        "Content-type": "application/json",
+        "Accept": "application/json"
+    }
+    body_href = os.path.splitext(style.body_href)[0] + '.json'
+
+    resp = catalog.http_request(
+        body_href,
+        method='put',
+        data=json.dumps(MS_FORCE_VISUAL_STYLE_METADATA),
+        headers=headers
+    )
+    if resp.status_code not in (200, 201, 202):
+        raise FailedRequestError('Failed to update style {} : {}, {}'.format(style.name, resp.status_code, resp.text))
+
+
+def set_dataset_style_to_open_in_visual_mode(dataset, catalog=gs_catalog):
+    style = get_dataset_style(dataset, catalog=catalog)
+    if style:
+        set_style_to_open_in_visual_mode(style, catalog=catalog)
+
 
 def set_default_style_to_open_in_visual_mode(instance, **kwargs):
+    """
+    Handler of the geoserver_automatic_default_style_set signal,
+    the style update is delegated to a background task
+    """
     if isinstance(instance, Dataset):
-        style = gs_catalog.get_style(instance.name, workspace=instance.workspace) or \
-            gs_catalog.get_style(isinstance.name)
-        if style:
-            headers = {
-                "Content-type": "application/json",
-                "Accept": "application/json"
-            }
-            data = {
-                "style": {
-                    "metadata": {
-                        "msForceVisual": "true"
-                    }
-                }
-            }
-            body_href = os.path.splitext(style.body_href)[0] + '.json'
-
-            resp = gs_catalog.http_request(body_href, method='put', data=json.dumps(data), headers=headers)
-            if resp.status_code not in (200, 201, 202):
-                raise FailedRequestError('Failed to update style {} : {}, {}'.format(style.name, resp.status_code, resp.text))
+        from geonode_mapstore_client.tasks import enqueue_style_visual_mode_update
+        enqueue_style_visual_mode_update(instance.id)
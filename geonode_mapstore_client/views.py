@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+#########################################################################
+#
+# Copyright 2022, GeoSolutions Sas.
+# All rights reserved.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+#
+#########################################################################
+import json
+import logging
+
+import requests
+from django.conf import settings
+from django.http import (
+    HttpResponse,
+    JsonResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    Http404,
+    StreamingHttpResponse
+)
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag, parse_etags
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_http_methods
+
+from geonode_mapstore_client.blobs import (
+    BlobPatchError,
+    apply_json_patch,
+    expand_blob,
+    get_blob_etag,
+    save_resource_blob
+)
+from geonode_mapstore_client.catalogue_services import (
+    get_catalogue_index,
+    get_indexed_catalogue_services,
+    is_catalogue_index_enabled,
+    is_catalogue_index_stale,
+    search_catalogue_index
+)
+from geonode_mapstore_client.geostory import SKELETON_SLICE, get_geostory_slice
+from geonode_mapstore_client.instrumentation import is_instrumentation_enabled, format_prometheus_metrics
+from geonode_mapstore_client.local_config import get_patched_local_config
+from geonode_mapstore_client.proxy import (
+    FORWARDED_REQUEST_HEADERS,
+    get_forwarded_response_headers,
+    get_proxy_cache_key,
+    get_proxy_response_cache,
+    get_proxy_session,
+    is_cacheable_request,
+    is_cacheable_response,
+    is_geoserver_url,
+    is_proxy_url_allowed,
+    stream_upstream_response
+)
+from geonode_mapstore_client.templatetags.apikey import get_cached_auth_token
+from geonode_mapstore_client.translations import get_merged_translations
+
+logger = logging.getLogger(__name__)
+
+
+def _local_config_etag(request):
+    return get_patched_local_config()[1]
+
+
+@require_GET
+@condition(etag_func=_local_config_etag)
+def local_config(request):
+    content, _ = get_patched_local_config()
+    if content is None:
+        raise Http404('localConfig.json not found')
+    response = HttpResponse(content, content_type='application/json')
+    response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response
+
+
+def _accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+
+
+def _translations_etag(request, locale):
+    translations = get_merged_translations(locale)
+    if not translations:
+        return None
+    # the gzipped and the plain responses are different representations
+    return f"{translations['etag']}-gzip" if _accepts_gzip(request) else translations['etag']
+
+
+@require_GET
+@condition(etag_func=_translations_etag)
+def translations(request, locale):
+    translations = get_merged_translations(locale)
+    if not translations:
+        raise Http404(f'Translations not found for locale {locale}')
+    if _accepts_gzip(request):
+        response = HttpResponse(translations['gzip'], content_type='application/json; charset=utf-8')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(translations['content'], content_type='application/json; charset=utf-8')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response
+
+
+@require_GET
+def metrics(request):
+    """
+    Metrics of the instrumented template tags and of the style updates in the Prometheus text format,
+    available to superusers and to the INTERNAL_IPS when MAPSTORE_INSTRUMENTATION is enabled
+    """
+    if not is_instrumentation_enabled():
+        raise Http404('Instrumentation is disabled')
+    if not request.user.is_superuser \
+            and request.META.get('REMOTE_ADDR') not in getattr(settings, 'INTERNAL_IPS', []):
+        raise Http404('Instrumentation is disabled')
+    from geonode_mapstore_client.tasks import get_style_visual_mode_metrics
+
+    extra_metrics = {
+        f'style_visual_mode_{name}': value
+        for name, value in get_style_visual_mode_metrics().items()
+    }
+    return HttpResponse(
+        format_prometheus_metrics(extra_metrics),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def proxy(request):
+    """
+    Forward the request to the url parameter through pooled connections and stream the response,
+    GetCapabilities, DescribeFeatureType and GetLegendGraphic responses are cached in memory
+    """
+    url = request.GET.get('url')
+    if not url:
+        return HttpResponseBadRequest('The url parameter is required')
+    if not is_proxy_url_allowed(url):
+        return HttpResponseForbidden('The url is not allowed')
+    headers = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers}
+    # the body is streamed as received so it's sent compressed only when the client accepts it
+    accept_encoding = 'gzip' if _accepts_gzip(request) else 'identity'
+    headers['Accept-Encoding'] = accept_encoding
+    auth_key = None
+    if request.user.is_authenticated and is_geoserver_url(url):
+        token = get_cached_auth_token(request.user)
+        if token:
+            # the posts sent with the credentials of the user, as WFS-T transactions, require the CSRF token
+            if request.method == 'POST':
+                csrf_failure = CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {})
+                if csrf_failure:
+                    return csrf_failure
+            headers['Authorization'] = f'Bearer {token}'
+            auth_key = str(request.user.pk)
+
+    cache_key = get_proxy_cache_key(url, accept_encoding, auth_key) \
+        if is_cacheable_request(request.method, url) else None
+    cached = get_proxy_response_cache().get(cache_key) if cache_key else None
+    if cached:
+        response = HttpResponse(cached['content'], status=cached['status'])
+        for name, value in cached['headers']:
+            response[name] = value
+        return response
+
+    try:
+        upstream = get_proxy_session().request(
+            request.method,
+            url,
+            headers=headers,
+            data=request.body if request.method == 'POST' else None,
+            stream=True,
+            allow_redirects=False,
+            timeout=getattr(settings, 'MAPSTORE_PROXY_TIMEOUT', 30)
+        )
+    except requests.RequestException as e:
+        logger.error(f'Proxy request to {url} failed: {e}')
+        return HttpResponse(status=502)
+
+    response = StreamingHttpResponse(
+        stream_upstream_response(upstream, cache_key if is_cacheable_response(upstream) else None),
+        status=upstream.status_code
+    )
+    for name, value in get_forwarded_response_headers(upstream):
+        response[name] = value
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def _get_positive_int(value, default, maximum=None):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    if value < 1:
+        return default
+    return min(value, maximum) if maximum else value
+
+
+@require_GET
+def catalogue_service_layers(request, service_id):
+    """
+    Paginated layers of a catalogue service filtered by the q parameter,
+    served from the index refreshed in background
+    """
+    if not is_catalogue_index_enabled() or service_id not in get_indexed_catalogue_services():
+        raise Http404(f'Catalogue service {service_id} not found')
+    from geonode_mapstore_client.tasks import enqueue_catalogue_service_index_refresh
+
+    index = get_catalogue_index(service_id)
+    if is_catalogue_index_stale(index):
+        enqueue_catalogue_service_index_refresh(service_id)
+    if index is None:
+        response = JsonResponse({'detail': 'The catalogue service is being indexed'}, status=503)
+        response['Retry-After'] = '10'
+        return response
+    page = _get_positive_int(request.GET.get('page'), 1)
+    page_size = _get_positive_int(request.GET.get('page_size'), 20, 100)
+    total, layers = search_catalogue_index(index, request.GET.get('q', ''), page, page_size)
+    response = JsonResponse({
+        'service': service_id,
+        'updated': index['updated'],
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'layers': layers
+    })
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+def _blob_response(blob, etag, status=200):
+    response = JsonResponse(blob, status=status, safe=False)
+    response['ETag'] = quote_etag(etag)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@require_http_methods(['GET', 'PATCH'])
+def resource_blob(request, pk):
+    """
+    Read the blob of a resource with its ETag or update it with a JSON patch,
+    the If-Match header makes the update fail with 412 if the blob has been changed in the meantime.
+    The blob is always returned expanded and it's stored compact when MAPSTORE_COMPACT_BLOBS is enabled
+    """
+    from geonode.base.models import ResourceBase
+
+    permission = 'base.view_resourcebase' if request.method == 'GET' else 'base.change_resourcebase'
+    queryset = ResourceBase.objects.non_polymorphic().only('id', 'resource_type', 'blob')
+    resource = get_object_or_404(queryset, pk=pk)
+    if not request.user.has_perm(permission, resource.get_self_resource()):
+        return HttpResponseForbidden('Not allowed')
+    if request.method == 'GET':
+        blob = expand_blob(resource.blob)
+        return _blob_response(blob, get_blob_etag(blob))
+
+    try:
+        operations = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest('The body must be a JSON patch')
+    with transaction.atomic():
+        resource = get_object_or_404(queryset.select_for_update(), pk=pk)
+        blob = expand_blob(resource.blob)
+        etag = get_blob_etag(blob)
+        if_match = request.META.get('HTTP_IF_MATCH')
+        if if_match and etag not in parse_etags(if_match) and '*' not in parse_etags(if_match):
+            return _blob_response(blob, etag, status=412)
+        try:
+            blob = apply_json_patch(blob, operations)
+        except BlobPatchError as e:
+            return HttpResponseBadRequest(str(e))
+        save_resource_blob(resource, blob)
+    return _blob_response(resource.blob, get_blob_etag(resource.blob))
+
+
+def _geostory_slice_response(request, pk, name):
+    from geonode.base.models import ResourceBase
+
+    queryset = ResourceBase.objects.non_polymorphic().filter(resource_type='geostory')
+    resource = get_object_or_404(queryset.only('id', 'resource_type'), pk=pk)
+    if not request.user.has_perm('base.view_resourcebase', resource.get_self_resource()):
+        return HttpResponseForbidden('Not allowed')
+    geostory_slice = get_geostory_slice(
+        resource.pk,
+        name,
+        lambda: expand_blob(queryset.only('id', 'resource_type', 'blob').get(pk=resource.pk).blob)
+    )
+    if geostory_slice is None:
+        raise Http404(f'Section {name} not found')
+    etag = quote_etag(geostory_slice['etag'])
+    response = HttpResponse(geostory_slice['content'], content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+@require_GET
+def geostory_skeleton(request, pk):
+    """
+    Settings, list of the sections and content of the first section of a geostory
+    """
+    return _geostory_slice_response(request, pk, SKELETON_SLICE)
+
+
+@require_GET
+def geostory_section(request, pk, section_id):
+    """
+    Content of a section of a geostory with the resources it references
+    """
+    if section_id == SKELETON_SLICE:
+        raise Http404(f'Section {section_id} not found')
+    return _geostory_slice_response(request, pk, section_id)